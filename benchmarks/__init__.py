@@ -0,0 +1 @@
+"""Performance benchmarks of schema, run them with `python -m benchmarks`."""
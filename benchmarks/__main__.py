@@ -0,0 +1,87 @@
+"""Runs the benchmarks, saves the results and compares them to a baseline.
+
+    python -m benchmarks                         # run all the benchmarks
+    python -m benchmarks dict list               # run the matching benchmarks
+    python -m benchmarks --save results.json     # save the results
+    python -m benchmarks --compare benchmarks/baseline.json
+
+The comparison exits with status 1 if a benchmark is slower than the baseline
+by more than --threshold (default: 1.25, 25% slower).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.workloads import BENCHMARKS  # noqa: E402
+
+
+def measure(setup, repeat, min_time):
+    """Returns the statistics of the time of one call, in seconds"""
+    timer = timeit.Timer(setup())
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "min": min(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "number": number,
+    }
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "%.2f %s" % (seconds / scale, unit)
+    return "%.0f ns" % (seconds / 1e-9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the benchmarks of schema")
+    parser.add_argument("names", nargs="*", help="run only the benchmarks containing one of these names")
+    parser.add_argument("--repeat", type=int, default=5, help="number of measures (default: 5)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum time of a measure (default: 0.2s)")
+    parser.add_argument("--save", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results to a saved baseline")
+    parser.add_argument("--threshold", type=float, default=1.25, help="maximum slowdown ratio (default: 1.25)")
+    args = parser.parse_args(argv)
+
+    names = [n for n in sorted(BENCHMARKS) if not args.names or any(a in n for a in args.names)]
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results, regressions = {}, []
+    for name in names:
+        result = results[name] = measure(BENCHMARKS[name], args.repeat, args.min_time)
+        line = "%-28s %12s +- %-10s" % (name, format_time(result["mean"]), format_time(result["stdev"]))
+        if name in baseline:
+            ratio = result["min"] / baseline[name]["min"]
+            line += " %5.2fx" % ratio
+            if ratio > args.threshold:
+                line += " SLOWER"
+                regressions.append(name)
+            elif ratio < 1 / args.threshold:
+                line += " faster"
+        print(line)
+        sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if regressions:
+        print("%d regression%s: %s" % (len(regressions), "s" if len(regressions) > 1 else "", ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
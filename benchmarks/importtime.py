@@ -0,0 +1,68 @@
+"""Measures the import time of schema with `python -X importtime`.
+
+    python -m benchmarks.importtime                 # check the default budget
+    python -m benchmarks.importtime --budget 3000   # budget in microseconds
+
+Exits with status 1 if the best cumulative import time of schema is above the
+budget. The module is compiled first, so that only the import is measured.
+"""
+
+import argparse
+import os
+import py_compile
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET = 5000  # microseconds
+
+
+CODE = "import sys; before = set(sys.modules); import schema; print(' '.join(sorted(set(sys.modules) - before)))"
+
+
+def import_time():
+    """Returns the cumulative import time of schema, and the modules it imports"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CODE],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    total = None
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        if name.strip() == "schema":
+            total = int(cumulative)
+    modules = [name for name in output.stdout.split() if name != "schema"]
+    return total, modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures the import time of schema")
+    parser.add_argument("--budget", type=int, default=BUDGET, help="budget in microseconds (default: %d)" % BUDGET)
+    parser.add_argument("--repeat", type=int, default=10, help="number of measures (default: 10)")
+    args = parser.parse_args(argv)
+
+    py_compile.compile(os.path.join(ROOT, "schema.py"), doraise=True)
+    times, modules = [], []
+    for _ in range(args.repeat):
+        total, modules = import_time()
+        times.append(total)
+    best = min(times)
+    print("import schema: %d us (best of %d, budget %d us)" % (best, args.repeat, args.budget))
+    if modules:
+        print("also imported: %s" % ", ".join(modules))
+    if best > args.budget:
+        print("over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
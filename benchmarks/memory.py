@@ -0,0 +1,57 @@
+"""Measures the memory held by validated records with `tracemalloc`.
+
+    python -m benchmarks.memory                     # 1,000,000 records
+    python -m benchmarks.memory --records 100000
+
+Validates the records with `Dict` returning dicts, and with the `into`
+parameter returning tuples, namedtuples and instances of a class with
+__slots__, and prints the memory held by the validated records.
+"""
+
+import argparse
+import collections
+import gc
+import sys
+import tracemalloc
+
+from schema import Dict, Optional
+
+Record = collections.namedtuple("Record", "id name score tags")
+
+
+class SlotsRecord(object):
+    __slots__ = ("id", "name", "score", "tags")
+
+    def __init__(self, id, name, score, tags):
+        self.id, self.name, self.score, self.tags = id, name, score, tags
+
+
+KEYS = {"id": int, "name": str, "score": float, Optional("tags"): [str]}
+OUTPUTS = [("dict", None), ("tuple", "tuple"), ("namedtuple", Record), ("slots", SlotsRecord)]
+
+
+def measure(into, records):
+    """Returns the memory in bytes held by the validated records"""
+    schema = Dict(KEYS, into=into)
+    gc.collect()
+    tracemalloc.start()
+    validated = [schema.validate({"id": i, "name": "name", "score": 0.5}) for i in range(records)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del validated
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures the memory held by validated records")
+    parser.add_argument("--records", type=int, default=1000000, help="number of records (default: 1000000)")
+    args = parser.parse_args(argv)
+
+    for name, into in OUTPUTS:
+        size = measure(into, args.records)
+        print("%-12s %8.1f MB %6.1f bytes/record" % (name, size / 2 ** 20, size / args.records))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,449 @@
+"""The benchmarked workloads.
+
+Each workload is a function decorated with `benchmark`, building its schema
+and its data, and returning the function to time.
+"""
+
+import asyncio
+import dataclasses
+import sys
+import types
+
+from schema import (
+    And,
+    Any,
+    Cached,
+    Dict,
+    In,
+    Lazy,
+    List,
+    Object,
+    Optional,
+    Or,
+    Regex,
+    Schema,
+    SchemaError,
+    Use,
+)
+
+BENCHMARKS = {}  # the workloads by name
+
+
+def benchmark(name):
+    """Decorator registering a workload"""
+
+    def aux(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return aux
+
+
+def _invalid(schema, data):
+    """Returns a function validating data, that must fail"""
+
+    def run():
+        try:
+            schema.validate(data)
+        except SchemaError:
+            return
+        raise AssertionError("%r should not be valid" % (data,))
+
+    return run
+
+
+@benchmark("dict_wide")
+def dict_wide():
+    schema = Schema({"key%d" % i: int for i in range(30)})
+    data = {"key%d" % i: i for i in range(30)}
+    return lambda: schema.validate(data)
+
+
+@benchmark("dict_wide_mapping")
+def dict_wide_mapping():
+    schema = Schema({"key%d" % i: int for i in range(30)})
+    data = types.MappingProxyType({"key%d" % i: i for i in range(30)})
+    return lambda: schema.validate(data)
+
+
+@benchmark("dict_small")
+def dict_small():
+    schema = Schema({"id": int, "name": str, Optional("tags"): [str]})
+    data = {"id": 1, "name": "name"}
+    return lambda: schema.validate(data)
+
+
+@benchmark("dict_small_stats")
+def dict_small_stats():
+    schema = Schema({"id": int, "name": str, Optional("tags"): [str]}, stats=True)
+    data = {"id": 1, "name": "name"}
+    return lambda: schema.validate(data)
+
+
+@benchmark("dict_ignore_extra_keys")
+def dict_ignore_extra_keys():
+    schema = Schema({"key%d" % i: int for i in range(8)}, ignore_extra_keys=True)
+    data = {"key%d" % i: i for i in range(500)}
+    return lambda: schema.validate(data)
+
+
+@benchmark("dict_type_keys")
+def dict_type_keys():
+    schema = Schema({str: int, int: str})
+    data = {"key%d" % i: i for i in range(50)}
+    data.update({i: str(i) for i in range(50)})
+    return lambda: schema.validate(data)
+
+
+@benchmark("dict_regex_keys")
+def dict_regex_keys():
+    schema = Schema({Regex(r"^x-[a-z]+$"): str, Regex(r"^[a-z]+$"): int})
+    data = {"x-" + chr(97 + i % 26) * (i + 1): "v" for i in range(25)}
+    data.update({chr(97 + i % 26) * (i + 1): i for i in range(25)})
+    return lambda: schema.validate(data)
+
+
+@benchmark("dict_optional_defaults")
+def dict_optional_defaults():
+    schema = Schema({"id": int, Optional("a", default=1): int, Optional("b", default="b"): str,
+                     Optional("c", default=list): [int], Optional("d", default=None): Or(None, int)})
+    data = {"id": 1}
+    return lambda: schema.validate(data)
+
+
+@benchmark("dict_many_defaults")
+def dict_many_defaults():
+    definition = {Optional("key%d" % i, default=i): int for i in range(20)}
+    definition.update({Optional("list%d" % i, default=[]): [int] for i in range(5)})
+    schema = Schema(dict(definition, id=int))
+    data = {"id": 1}
+    return lambda: schema.validate(data)
+
+
+@benchmark("dict_deep")
+def dict_deep():
+    schema = Schema(int)
+    for _ in range(50):
+        schema = Schema({"child": schema, Optional("name"): str})
+    data = 1
+    for _ in range(50):
+        data = {"child": data, "name": "name"}
+    return lambda: schema.validate(data)
+
+
+@benchmark("list_ints")
+def list_ints():
+    schema = Schema([int])
+    data = list(range(10000))
+    return lambda: schema.validate(data)
+
+
+@benchmark("list_ints_sampled")
+def list_ints_sampled():
+    schema = List([int], sample=0.01)
+    data = list(range(100000))
+    return lambda: schema.validate(data)
+
+
+@benchmark("list_records")
+def list_records():
+    schema = Schema([{"id": int, "name": str, "score": Or(int, float)}])
+    data = [{"id": i, "name": "name%d" % i, "score": i / 2} for i in range(1000)]
+    return lambda: schema.validate(data)
+
+
+@benchmark("list_records_into_tuple")
+def list_records_into_tuple():
+    schema = Schema([Dict({"id": int, "name": str, "score": Or(int, float)}, into="tuple")])
+    data = [{"id": i, "name": "name%d" % i, "score": i / 2} for i in range(1000)]
+    return lambda: schema.validate(data)
+
+
+def _csv_rows():
+    return [["id", "name", "score"]] + [[str(i), "name%d" % i, str(i / 2)] for i in range(1000)]
+
+
+@benchmark("csv_dicts")
+def csv_dicts():
+    schema = Schema([{"id": Use(int), "name": str, "score": Use(float)}])
+    rows = _csv_rows()
+    return lambda: schema.validate([dict(zip(rows[0], row)) for row in rows[1:]])
+
+
+@benchmark("csv_rows")
+def csv_rows():
+    schema = Dict({"id": Use(int), "name": str, "score": Use(float)})
+    rows = _csv_rows()
+    return lambda: list(schema.validate_rows(rows))
+
+
+@benchmark("csv_rows_into_tuple")
+def csv_rows_into_tuple():
+    schema = Dict({"id": Use(int), "name": str, "score": Use(float)}, into="tuple")
+    rows = _csv_rows()
+    return lambda: list(schema.validate_rows(rows))
+
+
+@dataclasses.dataclass
+class _Record:
+    id: int
+    name: str
+    tags: tuple
+
+
+def _records():
+    return [_Record(i, "name%d" % i, ("a", "b")) for i in range(1000)]
+
+
+@benchmark("object_records")
+def object_records():
+    schema = Schema([Object(_Record, {"id": int, "name": str, "tags": (str,)})])
+    data = _records()
+    return lambda: schema.validate(data)
+
+
+@benchmark("object_records_asdict")
+def object_records_asdict():
+    schema = Schema([{"id": int, "name": str, "tags": (str,)}])
+    data = _records()
+    return lambda: schema.validate([dataclasses.asdict(record) for record in data])
+
+
+@benchmark("or_many_constants")
+def or_many_constants():
+    values = ["value%d" % i for i in range(1000)]
+    schema = Or(*values)
+    return lambda: schema.validate("value999")
+
+
+@benchmark("or_many_constants_miss")
+def or_many_constants_miss():
+    schema = Or(*("value%d" % i for i in range(1000)))
+    return _invalid(schema, "other")
+
+
+@benchmark("in_many_values")
+def in_many_values():
+    schema = Schema([In("value%d" % i for i in range(1000))])
+    data = ["value%d" % (i * 7 % 1000) for i in range(1000)]
+    return lambda: schema.validate(data)
+
+
+@benchmark("in_many_values_miss")
+def in_many_values_miss():
+    schema = In("value%d" % i for i in range(1000))
+    return _invalid(schema, "other")
+
+
+@benchmark("or_failing_first")
+def or_failing_first():
+    schema = Schema([Or(None, bool, float, str, {"id": int}, [int], int)])
+    data = list(range(1000))
+    return lambda: schema.validate(data)
+
+
+@benchmark("or_mixed_types")
+def or_mixed_types():
+    schema = Schema([Or(int, str, {"id": int}, [int])])
+    data = [1, "a", {"id": 1}, [1, 2]] * 250
+    return lambda: schema.validate(data)
+
+
+@benchmark("and_nested")
+def and_nested():
+    schema = Schema([And(And(int, And(lambda n: n >= 0)), Or(Or(int, float), str))])
+    data = list(range(1000))
+    return lambda: schema.validate(data)
+
+
+@benchmark("and_or_composed")
+def and_or_composed():
+    item = Or(None, Or(Or(float, int), str))
+    for _ in range(5):
+        item = And(And(item), Any())
+    schema = Schema([item])
+    data = list(range(1000))
+    return lambda: schema.validate(data)
+
+
+@benchmark("errors_missing_key")
+def errors_missing_key():
+    schema = Schema({"key%d" % i: int for i in range(30)})
+    return _invalid(schema, {"key%d" % i: i for i in range(29)})
+
+
+@benchmark("errors_nested_value")
+def errors_nested_value():
+    schema = Schema({"items": [{"id": int, "name": str}]})
+    data = {"items": [{"id": i, "name": "name"} for i in range(100)] + [{"id": "x", "name": "name"}]}
+    return _invalid(schema, data)
+
+
+@benchmark("regex_search_long")
+def regex_search_long():
+    schema = Regex(r"a")
+    data = "b" * 2 ** 20
+    return _invalid(schema, data)
+
+
+@benchmark("regex_match_long")
+def regex_match_long():
+    schema = Regex(r"a", match="match")
+    data = "b" * 2 ** 20
+    return _invalid(schema, data)
+
+
+@benchmark("regex_validate_many")
+def regex_validate_many():
+    schema = Regex(r"^[a-z]+$")
+    data = ["abc%s" % chr(97 + i % 26) for i in range(1000)]
+    return lambda: schema.validate_many(data)
+
+
+@benchmark("cached_or")
+def cached_or():
+    schema = Schema([Cached(Or(*(Regex(r"^%s[0-9]+$" % chr(97 + i)) for i in range(26))))])
+    data = ["z%d" % (i % 10) for i in range(1000)]
+    return lambda: schema.validate(data)
+
+
+@benchmark("use_transform")
+def use_transform():
+    schema = Schema([{"id": Use(int), "value": Use(float)}])
+    data = [{"id": str(i), "value": "1.5"} for i in range(500)]
+    return lambda: schema.validate(data)
+
+
+def _deep_schema_and_data(depth):
+    schema = Schema(int)
+    for _ in range(depth):
+        schema = Dict({"c": List(schema)})
+    data = 1
+    for _ in range(depth):
+        data = {"c": [data]}
+    return schema, data
+
+
+@benchmark("deep_1000_recursive")
+def deep_1000_recursive():
+    schema, data = _deep_schema_and_data(1000)
+
+    def run():
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(20000)
+        try:
+            schema.validate(data)
+        finally:
+            sys.setrecursionlimit(limit)
+
+    return run
+
+
+@benchmark("deep_1000_iterative")
+def deep_1000_iterative():
+    schema, data = _deep_schema_and_data(1000)
+    return lambda: schema.validate_iterative(data)
+
+
+@benchmark("lazy_tree")
+def lazy_tree():
+    node = Schema({"value": int, Optional("children"): [Lazy(lambda: node)]})
+    data = {"value": 0, "children": [{"value": i, "children": [{"value": j} for j in range(10)]} for i in range(10)]}
+    return lambda: node.validate(data)
+
+
+@benchmark("async_list_records")
+def async_list_records():
+    async def resolve(value):
+        return value
+
+    schema = Schema([{"id": Use(resolve), "name": str}])
+    data = [{"id": i, "name": "name"} for i in range(200)]
+    return lambda: asyncio.run(schema.validate_async(data))
+
+
+@benchmark("async_list_ints")
+def async_list_ints():
+    schema = Schema([int])
+    data = list(range(10000))
+    return lambda: asyncio.run(schema.validate_async(data))
+
+
+@benchmark("async_list_records_sync")
+def async_list_records_sync():
+    schema = Schema([{"id": Use(lambda value: value), "name": str}])
+    data = [{"id": i, "name": "name"} for i in range(200)]
+    return lambda: asyncio.run(schema.validate_async(data))
+
+
+def _document():
+    schema = Schema({"name": str, "servers": [{"host": str, "port": int, Optional("tags"): [str]}],
+                     "settings": {str: Or(int, str, bool)}})
+    data = {"name": "config", "servers": [{"host": "h%d" % i, "port": i, "tags": ["a", "b"]} for i in range(1000)],
+            "settings": {"key%d" % i: i for i in range(100)}}
+    return schema, data
+
+
+@benchmark("document_full")
+def document_full():
+    schema, data = _document()
+    return lambda: schema.validate(data)
+
+
+@benchmark("document_incremental")
+def document_incremental():
+    schema, data = _document()
+    previous = schema.validate(data)
+    data["servers"][500]["port"] = 1
+    return lambda: schema.validate_incremental(data, ["/servers/500/port"], previous)
+
+
+@benchmark("document_project")
+def document_project():
+    schema, data = _document()
+    schema = schema.project(["name", "settings"])
+    return lambda: schema.validate(data)
+
+
+@benchmark("document_view")
+def document_view():
+    schema, data = _document()
+
+    def run():
+        document = schema.view(data)
+        return document["name"], document["servers"][500]["port"]
+
+    return run
+
+
+@benchmark("construct_wide_dict")
+def construct_wide_dict():
+    definition = {Optional("key%d" % i): Or(int, str, [int]) for i in range(100)}
+    definition.update({str: object, Regex(r"^x-"): str})
+    return lambda: Schema(definition)
+
+
+def _wide_dict():
+    definition = {Optional("key%d" % i): Or(int, str, [int]) for i in range(100)}
+    definition.update({str: object, Regex(r"^x-"): str})
+    return Schema(definition)
+
+
+@benchmark("build_wide_dict")
+def build_wide_dict():
+    return _wide_dict
+
+
+@benchmark("load_wide_dict")
+def load_wide_dict():
+    import pickle
+    pickled = pickle.dumps(_wide_dict(), pickle.HIGHEST_PROTOCOL)
+    return lambda: pickle.loads(pickled)
+
+
+@benchmark("json_schema_openapi")
+def json_schema_openapi():
+    item = {"id": int, "name": str, Optional("tags"): [str], Optional("score"): Or(int, float, None),
+            Optional("kind"): Or("a", "b", "c"), Regex(r"^x-"): str}
+    schema = Schema({"key%d" % i: item for i in range(50)})
+    return lambda: schema.json_schema(target="openapi")
@@ -2,13 +2,7 @@
 obtained from config-files, forms, external services or command-line
 parsing, converted from JSON/YAML (or something else) to Python data-types."""
 
-import re
-import copy
-
-try:
-    from contextlib import ExitStack
-except ImportError:
-    from contextlib2 import ExitStack
+# only light modules are imported here, the other ones are imported when needed
 
 try: basestring
 except: basestring = str
@@ -18,10 +12,12 @@ __all__ = [
     "BaseSchema",
     "Schema",
     "Dict",
+    "Object",
     "List",
     "Any",
     "And",
     "Or",
+    "In",
     "Regex",
     "Optional",
     "Use",
@@ -30,6 +26,9 @@ __all__ = [
     "Forbidden",
     "Const",
     "Not",
+    "Cached",
+    "Lazy",
+    "Ref",
     "SchemaError",
     "SchemaWrongKeyError",
     "SchemaMissingKeyError",
@@ -38,9 +37,14 @@ __all__ = [
     "SchemaOnlyOneAllowedError",
     "SchemaWrongLengthError",
     "SchemaForbiddenValueError",
+    "SchemaDepthError",
+    "ValidationStats",
 
 ]
 
+# the priorities of the kinds of schemas, the lowest ones are tried first
+COMPARABLE, CALLABLE, VALIDATOR, TYPE, DICT, ITERABLE = range(10, 70, 10)
+
 
 class SchemaError(Exception):
     """Error during Schema validation."""
@@ -126,7 +130,125 @@ class SchemaForbiddenValueError(SchemaError):
     pass
 
 
-OPTIONS = {'ignore_extra_keys', 'regex_lib'}
+class SchemaDepthError(SchemaError):
+    """Error should be raised when the data is nested too deeply"""
+
+    pass
+
+
+class ValidationStats(object):
+    """
+    Counts the validations of a schema, its failures by error class, and
+    their latency in a histogram
+    The counters are updated under a lock, so that a schema can be used by
+    several threads
+    """
+    # the upper bounds of the latency buckets, in seconds
+    BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+        0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, float('inf'))
+
+    def __init__(self, buckets=None):
+        """
+        buckets are the upper bounds of the latency buckets, in seconds
+        (default: ValidationStats.BUCKETS)
+        """
+        buckets = sorted(self.BUCKETS if buckets is None else buckets)
+        if buckets[-1] != float('inf'): buckets.append(float('inf'))
+        self.buckets = tuple(buckets)
+        from bisect import bisect_left
+        import threading
+        self._bisect = bisect_left
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        import threading
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Resets all the counters
+        """
+        with self._lock:
+            self.validations = 0
+            self.failures = {} # by error class name
+            self.counts = [0] * len(self.buckets) # by latency bucket
+            self.seconds = 0.0 # the sum of the latencies
+
+    def record(self, seconds, error=None):
+        """
+        Records a validation, that took seconds, and raised error if any
+        """
+        bucket = self._bisect(self.buckets, seconds)
+        with self._lock:
+            self.validations += 1
+            self.counts[bucket] += 1
+            self.seconds += seconds
+            if error is not None:
+                name = type(error).__name__
+                self.failures[name] = self.failures.get(name, 0) + 1
+
+    def to_dict(self):
+        """
+        Returns the counters as a dict, the latency buckets are cumulative
+        """
+        with self._lock:
+            counts, total = [], 0
+            for count in self.counts:
+                total += count
+                counts.append(total)
+            return {
+                'validations': self.validations,
+                'failures': dict(self.failures),
+                'latency': {
+                    'buckets': dict(zip(self.buckets, counts)),
+                    'sum': self.seconds,
+                    'count': self.validations,
+                },
+            }
+
+    def to_prometheus(self, prefix='schema_validation', labels=None):
+        """
+        Returns the counters in the Prometheus text format
+        Takes
+        - prefix: the prefix of the metric names
+        - labels: a dict of labels added to all the metrics
+        """
+        def format_labels(**extra):
+            items = dict(labels or {}, **extra).items()
+            if not items: return ''
+            return '{%s}' % ','.join('%s="%s"' % (name, str(value)
+                .replace('\\', '\\\\').replace('"', '\\"')
+                .replace('\n', '\\n')) for name, value in sorted(items))
+        stats = self.to_dict()
+        latency = stats['latency']
+        lines = [
+            '# TYPE %s_total counter' % prefix,
+            '%s_total%s %d' % (prefix, format_labels(), stats['validations']),
+            '# TYPE %s_failures_total counter' % prefix,
+        ]
+        for name, count in sorted(stats['failures'].items()):
+            lines.append('%s_failures_total%s %d' % (prefix,
+                format_labels(error=name), count))
+        lines.append('# TYPE %s_seconds histogram' % prefix)
+        for bound, count in latency['buckets'].items():
+            le = '+Inf' if bound == float('inf') else repr(float(bound))
+            lines.append('%s_seconds_bucket%s %d' % (prefix,
+                format_labels(le=le), count))
+        lines.append('%s_seconds_sum%s %r' % (prefix, format_labels(),
+            latency['sum']))
+        lines.append('%s_seconds_count%s %d' % (prefix, format_labels(),
+            latency['count']))
+        return '\n'.join(lines) + '\n'
+
+
+OPTIONS = {'ignore_extra_keys', 'regex_lib', 'strict'}
 DEFAULT_CLS = {}
 def schema_class(name=None):
     """Decorator for naming BaseSchema subclasses"""
@@ -140,24 +262,82 @@ def schema_class(name=None):
         return cls
     return aux
 
+STEPS = {} # the generators validating without recursion, by validate method
+def _steps_for(validate, nested=False):
+    """
+    Decorator registering a generator that validates like the validate
+    method, but yields the (schema, data) to validate instead of recursing.
+    The validated data is sent back, or the error is thrown in the generator.
+    nested tells if the generator validates a nesting level of the data.
+    """
+    def aux(steps):
+        STEPS[validate] = (steps, nested)
+        return steps
+    return aux
+
+# the JSON schema definitions being generated, in a threading.local made on
+# first use
+_json_schema_locals = {}
+def _json_schema_local():
+    """
+    Returns the threading.local of the JSON schema definitions being generated
+    """
+    try: return _json_schema_locals['local']
+    except KeyError: pass
+    import threading
+    return _json_schema_locals.setdefault('local', threading.local())
+
+def _json_schema_definitions(json_schema):
+    """
+    Decorator for json_schema methods.
+    The first call of a generation collects the definitions of the Lazy schemas
+    met, and adds them to the generated JSON schema.
+    """
+    def aux(self, *args, **kwargs):
+        local = _json_schema_local()
+        if getattr(local, 'definitions', None) is not None:
+            return json_schema(self, *args, **kwargs)
+        local.definitions = definitions = {}
+        local.names = {}
+        try: schema_dict = json_schema(self, *args, **kwargs)
+        finally: local.definitions = None
+        if definitions and isinstance(schema_dict, dict):
+            schema_dict = dict(schema_dict, definitions=definitions)
+        return schema_dict
+    aux.__name__, aux.__qualname__ = json_schema.__name__, json_schema.__qualname__
+    aux.__doc__, aux.__wrapped__ = json_schema.__doc__, json_schema
+    return aux
+
 class BaseSchema(object):
     """The base class of all Schema classes"""
 
     # Marker for an optional part of the validation Schema
     _MARKER = object()
+    # If the validation has no side effect and always gives the same result
+    pure = False
+    # The only_one Or schemas that a matching key matches, see Dict
+    _only_one = ()
+    # The ValidationStats of the schema, if enabled
+    stats = None
 
     def __init__(self, error=None, name=None, json_schema=_MARKER,
-        options=None, **_options):
+        options=None, stats=None, **_options):
         """
         Takes
         - error: a human readable error
         - name: the name of the schema
         - json_schema: the JSON_schema of this schema
         - options: a dict of options to propagate
+        - stats: True or a ValidationStats to record the validations of this
+            schema in, see the stats attribute (default: the stats option)
         default options are (and can be passed by as argument)
         - ignore_extra_keys: if dict objects should ignore unmatched keys
+        - strict: if dict schemas only accept dict objects, not the other
+            mappings
         - regex_lib: the lib to use for regex, must provide compile function
         - schema, list, dict, ...: the class to use instead of the default ones
+        other options can be given in options
+        - stats: True to record the validations of all the schemas
         """
         self._error = error
         self._name = name
@@ -172,11 +352,45 @@ class BaseSchema(object):
             raise TypeError('options must be a "dict", got "%s"' % type(options))
         schema_class = getattr(self, 'SCHEMA_CLASS', None)
         if schema_class: _options.setdefault(schema_class, type(self))
-        if _options:
+        # the options are shared by the schemas when possible
+        if any(options.get(option, self._MARKER) is not value
+                for option, value in _options.items()):
             self.options = options.copy()
             self.options.update(_options)
         else:
             self.options = options
+        if stats is None: stats = self.options.get('stats', False)
+        if stats is True: stats = ValidationStats()
+        # the validation methods are only wrapped when needed
+        if stats:
+            self.stats = stats
+            self.validate = self._validate_with_stats
+            self.validate_async = self._validate_async_with_stats
+
+    def __getstate__(self):
+        # the modules of the options (like regex_lib) are pickled by name
+        from types import ModuleType
+        state = self.__dict__.copy()
+        modules = {option: value.__name__ for option, value
+            in self.options.items() if isinstance(value, ModuleType)}
+        if modules:
+            state['options'] = {option: value for option, value
+                in self.options.items() if option not in modules}
+            state['_option_modules'] = modules
+        return state
+
+    def __setstate__(self, state):
+        modules = state.pop('_option_modules', None)
+        if modules:
+            import importlib
+            state['options'].update((option, importlib.import_module(name))
+                for option, name in modules.items())
+        self.__dict__.update(state)
+
+    def __init_subclass__(cls, **kwargs):
+        super(BaseSchema, cls).__init_subclass__(**kwargs)
+        if 'json_schema' in cls.__dict__:
+            cls.json_schema = _json_schema_definitions(cls.__dict__['json_schema'])
 
     def is_valid(self, data):
         """
@@ -196,6 +410,275 @@ class BaseSchema(object):
         """
         self._raise_error('no validation method', data)
 
+    def _validate_with_stats(self, data):
+        """
+        Validates data, and records the validation in stats
+        """
+        from time import perf_counter
+        start = perf_counter()
+        try:
+            result = type(self).validate(self, data)
+        except BaseException as x:
+            self.stats.record(perf_counter() - start, x)
+            raise
+        self.stats.record(perf_counter() - start)
+        return result
+
+    async def _validate_async_with_stats(self, data, limit=None):
+        """
+        Validates data asynchronously, and records the validation in stats
+        """
+        from time import perf_counter
+        start = perf_counter()
+        try:
+            result = await type(self).validate_async(self, data, limit)
+        except BaseException as x:
+            self.stats.record(perf_counter() - start, x)
+            raise
+        self.stats.record(perf_counter() - start)
+        return result
+
+    async def validate_async(self, data, limit=None):
+        """
+        The function to validate data asynchronously
+        Coroutines returned by Use and Hook callables are awaited, those of a
+        same Dict or List are run concurrently
+        Takes
+        - data: the data to validate
+        - limit: the maximum number of coroutines run concurrently, an int or
+            an asyncio.Semaphore (default: no limit)
+        """
+        return self.validate(data)
+
+    @property
+    def _awaits(self):
+        """
+        Whether validate_async may await something, else it is the same as
+        validate
+        """
+        return type(self).validate_async.__module__ != __name__
+
+    @property
+    def _may_await(self):
+        # computed once, the schemas are not modified once built
+        try: return self.__dict__['_may_await_value']
+        except KeyError: pass
+        self._may_await_value = may_await = self._awaits
+        return may_await
+
+    def validate_incremental(self, data, paths, previous):
+        """
+        Validates data, a modified version of a document validated as
+        previous, by only validating again the dicts and lists along the
+        modified paths: the other values of previous are reused
+        The dicts along the paths are still checked (length, required keys,
+        only_one, extra keys, defaults)
+        Takes
+        - data: the modified document
+        - paths: the modified paths, each one a sequence of keys and indices,
+            or a JSON pointer like '/servers/0/port'
+        - previous: the previous result of the validation
+        The schemas must give the same result for the same data, a list whose
+        items are inserted or removed must be in the paths
+        """
+        changes = {} # a tree of the changes, None if everything changed
+        for path in paths:
+            if isinstance(path, basestring):
+                path = [key.replace('~1', '/').replace('~0', '~')
+                    for key in path.split('/')[1:]] if path else []
+            if not path: return self.validate(data)
+            node = changes
+            for key in path[:-1]:
+                child = node.get(key, {})
+                if child is None: break
+                node[key] = node = child
+            else: node[path[-1]] = None
+        return self._validate_incremental(data, changes, previous)
+
+    def _validate_incremental(self, data, changes, previous):
+        """
+        Validates data incrementally, changes is a tree of the changes
+        By default the data is validated again
+        """
+        return self.validate(data)
+
+    def project(self, paths):
+        """
+        Returns a schema validating and returning only the selected paths of
+        the data, the other keys of the dicts along the paths are ignored
+        (the selected required keys are still checked)
+        Takes
+        - paths: the selected paths, each one a string like 'meta.tenant' or
+            'items[].id' ('[]' selects the items of a list), or a sequence
+            of keys and '[]'
+        The schemas that cannot be pruned (Use, callables, ...) validate
+        their whole data
+        Raises ValueError if a selected key matches no key schema
+        """
+        selection = {} # a tree of the selected keys, None for everything
+        for path in paths:
+            if isinstance(path, basestring):
+                keys = []
+                for part in path.split('.'):
+                    lists = 0
+                    while part.endswith('[]'):
+                        part, lists = part[:-2], lists + 1
+                    if part: keys.append(part)
+                    keys.extend(['[]'] * lists)
+                path = keys
+            if not path: return self
+            node = selection
+            for key in path[:-1]:
+                child = node.get(key, {})
+                if child is None: break
+                node[key] = node = child
+            else: node[path[-1]] = None
+        return self._project(selection)
+
+    def _project(self, selection):
+        """
+        Returns a schema validating the selection, a tree of the selected
+        keys. By default the schema cannot be pruned and is returned
+        """
+        return self
+
+    def view(self, data):
+        """
+        Returns data validated lazily: the dicts and lists are returned as
+        read-only views validating each value on first access (the result is
+        kept), only their type, length and keys are checked up front
+        By default data is validated
+        """
+        return self.validate(data)
+
+    def validate_iterative(self, data, max_depth=None):
+        """
+        Validates data using an explicit stack instead of recursion, so that
+        deeply nested data does not exhaust the Python stack
+        Takes
+        - data: the data to validate
+        - max_depth: the maximum number of nested dicts and lists, raises
+            SchemaDepthError if exceeded (default: no limit)
+        Only the built-in schemas are validated without recursion
+        """
+        stack = [] # the generators being run, and if they are nested
+        depth = 0 # the number of nested generators
+        sub = (self, data) # the schema and the data to validate next
+        result, error = None, None # the last result or error
+        while True:
+            if sub is not None:
+                schema, data = sub
+                steps, nested = STEPS.get(
+                    getattr(schema.validate, '__func__', None), (None, False))
+                # simple schemas are validated directly
+                if steps is None or \
+                        getattr(schema, '_flavor', VALIDATOR) != VALIDATOR:
+                    try: result, error = schema.validate(data), None
+                    except BaseException as x: result, error = None, x
+                elif nested and max_depth is not None and depth >= max_depth:
+                    for generator, _ in stack: generator.close()
+                    raise SchemaDepthError(
+                        "Maximum depth of %d exceeded" % max_depth)
+                else:
+                    stack.append((steps(schema, data), nested))
+                    depth += nested
+                    result, error = None, None
+            if not stack:
+                if error is not None: raise error
+                return result
+            # send the result or the error to the last generator
+            generator, nested = stack[-1]
+            try:
+                if error is None: sub = generator.send(result)
+                else: sub = generator.throw(error)
+            except StopIteration as x:
+                result, error, sub = x.value, None, None
+            except BaseException as x:
+                result, error, sub = None, x, None
+            else: continue
+            stack.pop()
+            depth -= nested
+
+    def dump(self, path, fingerprint=None):
+        """
+        Pickles the schema in path, with its precomputed tables, so that it
+        can be loaded without being built again
+        Takes
+        - path: the path of the file
+        - fingerprint: the fingerprint of the definition, see load
+        """
+        import os, pickle
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump((fingerprint, self), f, pickle.HIGHEST_PROTOCOL)
+            # other processes never read a partially written file
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path, *args, **kwargs):
+        """
+        Loads the schema pickled in path
+        If arguments are given, the pickled schema is only used if it was
+        built from the same arguments, otherwise cls(*args, **kwargs) is built
+        and pickled in path for the next time
+        The arguments are compared with a fingerprint of their repr (without
+        the memory addresses) and of the code of their functions
+        A schema that cannot be pickled (like one with lambdas) is built each
+        time, with a warning
+        """
+        import pickle
+        if not args and not kwargs:
+            with open(path, 'rb') as f:
+                return pickle.load(f)[1]
+        fingerprint = _fingerprint(cls, args, kwargs)
+        try:
+            with open(path, 'rb') as f:
+                stored, schema = pickle.load(f)
+        # a missing, corrupted or outdated file is replaced
+        except Exception:
+            stored = None
+        if stored == fingerprint and isinstance(schema, cls):
+            return schema
+        schema = cls(*args, **kwargs)
+        # dump removes its temporary file
+        try: schema.dump(path, fingerprint)
+        except (pickle.PicklingError, AttributeError, TypeError) as x:
+            import warnings
+            warnings.warn("%r cannot be pickled in %s: %s" % (schema, path, x),
+                RuntimeWarning, stacklevel=2)
+        return schema
+
+    def freeze(self):
+        """
+        Prepares the schema to be shared by forked processes
+        The lazy parts of the schema are built, then gc.freeze() moves all the
+        objects tracked by the garbage collector to a permanent generation, so
+        that the collections in the children do not write to their pages
+        Call it once everything is built, right before forking
+        Returns the schema
+        """
+        seen = set()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen: continue
+            seen.add(id(node))
+            if isinstance(node, Lazy): node.resolve()
+            if isinstance(node, BaseSchema): stack.extend(vars(node).values())
+            elif isinstance(node, dict):
+                stack.extend(node)
+                stack.extend(node.values())
+            elif isinstance(node, (list, tuple, set, frozenset)):
+                stack.extend(node)
+        import gc
+        # python < 3.7
+        if hasattr(gc, 'freeze'): gc.freeze()
+        return self
+
     def _raise_error(self, message, data, cls=SchemaError):
         """
         Raises a well formatted error
@@ -246,6 +729,7 @@ class BaseSchema(object):
         if hasattr(self, '_json_schema'):
             return self._json_schema_aux(schema_id, self._json_schema)
         return self._json_schema_aux(schema_id, None)
+    json_schema = _json_schema_definitions(json_schema)
 
     def _json_schema_aux(self, schema_id, schema_dict):
         """
@@ -264,6 +748,32 @@ class BaseSchema(object):
 
 
 
+def _inlined(schema, cls):
+    """
+    Returns the sub schemas that can replace schema in a cls schema (an And
+    in an And, an Or in an Or, or an And or Or of one schema), or None
+    """
+    if type(schema) not in (And, Or) or schema._error or schema._name or \
+        hasattr(schema, '_json_schema') or schema.stats is not None or \
+        getattr(schema, 'only_one', False):
+        return None
+    if type(schema) is cls or len(schema._args) == 1: return schema._args
+    return None
+
+def _identity(schema):
+    """
+    Returns a key equal for the schemas that validate the same way, or None
+    """
+    if type(schema) is Schema and schema.stats is None and \
+        not hasattr(schema, '_json_schema') and \
+        schema._flavor in (COMPARABLE, TYPE):
+        key = (schema._flavor, type(schema._schema), schema._schema,
+            schema._error, schema._name)
+        try: hash(key)
+        except TypeError: return None
+        return key
+    return None
+
 @schema_class('and')
 class And(BaseSchema):
     """
@@ -272,18 +782,41 @@ class And(BaseSchema):
 
     def __init__(self, *args, **kwargs):
         super(And, self).__init__(**kwargs)
-        self._args = [schema if isinstance(schema, BaseSchema)
-            else self._generate_cls('schema', schema) for schema in args]
+        self._args = []
+        for schema in args:
+            if not isinstance(schema, BaseSchema):
+                schema = self._generate_cls('schema', schema)
+            # the nested And are flattened, Any is removed
+            inlined = _inlined(schema, And)
+            if inlined is not None: self._args.extend(inlined)
+            elif type(schema) is not Any or schema.stats is not None:
+                self._args.append(schema)
 
-        resets = [schema.reset for schema in self._args
+        self._resets = [schema.reset for schema in self._args
             if hasattr(schema, 'reset')]
-        if resets and not hasattr(self, 'reset'):
-            self.reset = lambda: (reset() for reset in resets) and None
+        # a bound method, so that the schema can be pickled
+        if self._resets and not hasattr(self, 'reset'):
+            self.reset = self._reset_args
+        only_one = tuple(or_ for schema in self._args
+            for or_ in schema._only_one)
+        if only_one: self._only_one = only_one
 
     def __repr__(self):
         return "%s(%s)" % (self.__class__.__name__,
             ", ".join(repr(a) for a in self._args))
 
+    @property
+    def pure(self):
+        return all(schema.pure for schema in self._args)
+
+    def _reset_args(self):
+        for reset in self._resets: reset()
+
+    def _project(self, selection):
+        args = [schema._project(selection) for schema in self._args]
+        if all(a is b for a, b in zip(args, self._args)): return self
+        return self._generate_cls('and', *args)
+
     def validate(self, data):
         """
         Validate data using defined sub schema/expressions ensuring all
@@ -295,6 +828,22 @@ class And(BaseSchema):
             data = schema.validate(data)
         return data
 
+    async def validate_async(self, data, limit=None):
+        limit = _semaphore(limit)
+        for schema in self._args:
+            data = await schema.validate_async(data, limit)
+        return data
+
+    @property
+    def _awaits(self):
+        return any(schema._awaits for schema in self._args)
+
+    @_steps_for(validate)
+    def _steps(self, data):
+        for schema in self._args:
+            data = yield schema, data
+        return data
+
     def json_schema(self, schema_id=None, **kwargs):
         if hasattr(self, '_json_schema'):
             return self._json_schema_aux(schema_id, self._json_schema)
@@ -370,6 +919,10 @@ class And(BaseSchema):
         else: return dict(allOf=allOf)
 
 
+# the types of data that Or looks up directly
+_DATA_TYPES = (type(None), bool, int, float, str, bytes, list, tuple, dict,
+    set, frozenset)
+
 @schema_class('or')
 class Or(BaseSchema):
     """
@@ -380,23 +933,154 @@ class Or(BaseSchema):
     def __init__(self, *args, **kwargs):
         self.only_one = kwargs.pop("only_one", False)
         super(Or, self).__init__(**kwargs)
-        self._args = [schema if isinstance(schema, BaseSchema)
-            else self._generate_cls('schema', schema) for schema in args]
-        self.match_count = 0
+        self._args = []
+        for schema in args:
+            if not isinstance(schema, BaseSchema):
+                schema = self._generate_cls('schema', schema)
+            # the nested Or are flattened
+            inlined = _inlined(schema, Or)
+            if inlined is not None: self._args.extend(inlined)
+            else: self._args.append(schema)
+        self._args = self._simplify(self._args)
+        # the Dict schemas check that a single key matches
+        if self.only_one: self._only_one = (self,)
         self._resets = [schema.reset for schema in self._args
             if hasattr(schema, 'reset')]
+        if self._resets and not hasattr(self, 'reset'):
+            self.reset = self._reset_args
+        # the constants, if all the schemas only compare data to a constant
+        self._constants = self._constants_of(self._args)
+        # the schemas to try for each type of data, see _candidates
+        self._dispatch = self._types = None
+        if self._constants is None and len(self._args) > 1:
+            self._dispatch_types()
 
     def __repr__(self):
         return "%s(%s)" % (self.__class__.__name__,
             ", ".join(repr(a) for a in self._args))
 
-    def reset(self):
-        failed = self.match_count > 1 and self.only_one
-        self.match_count = 0
-        if failed:
-            raise SchemaOnlyOneAllowedError(["There are multiple keys present " + "from the %r condition" % self])
+    @property
+    def pure(self):
+        return all(schema.pure for schema in self._args)
+
+    def _reset_args(self):
         for reset in self._resets: reset()
 
+    def _project(self, selection):
+        # the schemas without the selected keys validate the whole data
+        args, error = [], None
+        for schema in self._args:
+            try: args.append(schema._project(selection))
+            except ValueError as x:
+                error = x
+                args.append(schema)
+        if all(a is b for a, b in zip(args, self._args)):
+            # no schema has the selected keys
+            if error is not None: raise error
+            return self
+        return self._generate_cls('or', *args, only_one=self.only_one)
+
+    @staticmethod
+    def _simplify(schemas):
+        """
+        Removes the schemas that are never tried (after Any) or always fail
+        (the same as a previous one), the last schema is kept for its error
+        """
+        for i, schema in enumerate(schemas):
+            if type(schema) is Any:
+                del schemas[i + 1:]
+                break
+        seen = set()
+        simplified = []
+        for i, schema in enumerate(schemas):
+            key = _identity(schema)
+            if key is not None and key in seen and i < len(schemas) - 1:
+                continue
+            seen.add(key)
+            simplified.append(schema)
+        return simplified
+
+    @staticmethod
+    def _constants_of(schemas):
+        """
+        Returns the frozenset of the constants that schemas compare data to,
+        or None if some schemas do something else
+        """
+        constants = []
+        for schema in schemas:
+            if not Dict._is_direct(schema): return None
+            constant = schema._schema
+            # not a constant, or cannot be found in a set (like nan)
+            try:
+                if hash(constant) is None or constant != constant: return None
+            except TypeError: return None
+            constants.append(constant)
+        return frozenset(constants) if constants else None
+
+    def _dispatch_types(self):
+        """
+        Computes the types of data each schema can validate (None for any
+        type), with the keys method like Dict, and the schemas to try for
+        each of these types
+        """
+        comparable_keys, type_keys, global_keys = {}, {}, []
+        for i, schema in enumerate(self._args):
+            if self._dispatchable(schema):
+                schema.keys(i, comparable_keys, type_keys, global_keys)
+            else: global_keys.append(i)
+        if not type_keys: return
+        # constants can be equal to data of any type
+        for items in comparable_keys.values(): global_keys.extend(items)
+        types = [() for _ in self._args]
+        for t, items in type_keys.items():
+            for i in items: types[i] += (t,)
+        for i in global_keys: types[i] = None
+        self._types = types
+        # the common types of data are looked up too, other types try all
+        # the schemas
+        self._dispatch = {t: self._candidates_for(t)
+            for t in set(type_keys).union(_DATA_TYPES)}
+
+    @staticmethod
+    def _dispatchable(schema):
+        """
+        Returns whether the keys method of schema tells the data it can
+        validate: the subclasses overriding validate (like converters) can
+        validate any data
+        """
+        # the schemas wrapped in a Schema are the ones validating
+        while type(schema) is Schema and schema._flavor == VALIDATOR:
+            schema = schema._schema
+        for cls in type(schema).__mro__:
+            if 'keys' in vars(cls): return True
+            if 'validate' in vars(cls): return False
+        return False
+
+    def _candidates_for(self, data_type):
+        """
+        Returns the schemas that can validate data of type data_type, in
+        order, and the last schema that gives the error if none matches
+        """
+        last = len(self._args) - 1
+        return tuple(schema for i, (schema, types) in
+            enumerate(zip(self._args, self._types))
+            if i == last or types is None or issubclass(data_type, types))
+
+    def _candidates(self, data):
+        """
+        Returns the schemas that can validate data, or None if data is one of
+        the constants
+        """
+        dispatch = self._dispatch
+        if dispatch is not None: return dispatch.get(type(data), self._args)
+        constants = self._constants
+        if constants is None: return self._args
+        try:
+            if data in constants: return None
+        except TypeError: pass
+        # the last schema gives the error
+        return self._args[-1:]
+
     def validate(self, data):
         """
         Validate data using sub defined schema/expressions ensuring at least
@@ -404,24 +1088,56 @@ class Or(BaseSchema):
         :param data: data to be validated by provided schema.
         :return: return validated data if not validation
         """
+        schemas = self._candidates(data)
+        if schemas is None: return data
         x = None
-        for schema in self._args:
+        for schema in schemas:
             try:
-                validation = schema.validate(data)
-                self.match_count += 1
-                if self.match_count > 1 and self.only_one:
-                    break
-                return validation
+                return schema.validate(data)
+            except SchemaError as _x:
+                x = _x
+        self._raise_or_error(data, x)
+
+    @property
+    def _awaits(self):
+        return any(schema._awaits for schema in self._args)
+
+    async def validate_async(self, data, limit=None):
+        schemas = self._candidates(data)
+        if schemas is None: return data
+        limit = _semaphore(limit)
+        x = None
+        for schema in schemas:
+            try:
+                return await schema.validate_async(data, limit)
+            except SchemaError as _x:
+                x = _x
+        self._raise_or_error(data, x)
+
+    @_steps_for(validate)
+    def _steps(self, data):
+        schemas = self._candidates(data)
+        if schemas is None: return data
+        x = None
+        for schema in schemas:
+            try:
+                return (yield schema, data)
             except SchemaError as _x:
                 x = _x
+        self._raise_or_error(data, x)
+
+    def _raise_or_error(self, data, x):
+        """
+        Raises the error of the last sub schema, or a new one
+        """
         if x:
             x.prepend(
-                "%r did not validate %r" % (self, data),
+                "%r did not validate %s" % (self, _repr(data)),
                 self._error.format(data) if self._error else None
             )
             raise x
         raise SchemaError(
-            ["%r did not validate %r" % (self, data)],
+            ["%r did not validate %s" % (self, _repr(data))],
             [self._error.format(data) if self._error else None],
         )
 
@@ -538,22 +1254,118 @@ class Or(BaseSchema):
             else: return dict(anyOf=anyOf)
 
 
+@schema_class('in')
+class In(BaseSchema):
+    """
+    Validates data equal to one of the values, with a hashed lookup.
+    """
+    priority = COMPARABLE
+    pure = True
+
+    def __init__(self, values, **kwargs):
+        super(In, self).__init__(**kwargs)
+        self._values = tuple(values)
+        # the unhashable values are compared one by one
+        hashable, self._others = [], []
+        for value in self._values:
+            try: hash(value)
+            except TypeError: self._others.append(value)
+            else: hashable.append(value)
+        # True == 1 and False == 0, but they are different values
+        self._set = frozenset(value for value in hashable if type(value) is not bool)
+        self._bools = frozenset(value for value in hashable if type(value) is bool)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self._values))
+
+    def validate(self, data):
+        try:
+            if data is True or data is False:
+                if data in self._bools: return data
+            elif data in self._set: return data
+            others = self._others
+        # unhashable data can be equal to any value
+        except TypeError: others = self._values
+        for value in others:
+            if value == data: return data
+        message = "%r does not match %s" % (self, _repr(data))
+        return self._raise_error(message, data, SchemaError)
+
+    def keys(self, item, comparable_keys, type_keys, global_keys):
+        # the keys equal to a bool are looked up with the ones of the other
+        # type, and are tried for any key
+        if self._others or self._bools or not self._set.isdisjoint((0, 1)):
+            global_keys.append(item)
+        else:
+            for value in self._set:
+                comparable_keys.setdefault(value, []).append(item)
+
+    def json_schema(self, schema_id=None, **kwargs):
+        """
+        Generates a {'enum': [...]} schema
+        """
+        if hasattr(self, '_json_schema'):
+            return self._json_schema_aux(schema_id, self._json_schema)
+        # no value matches nothing
+        if not self._values: schema_dict = False
+        else: schema_dict = Or.merge_json_schemas(
+            [dict(enum=list(self._values))], **kwargs)
+        return self._json_schema_aux(schema_id, schema_dict)
+
+
 @schema_class('regex')
 class Regex(BaseSchema):
     """
     Enables schema.py to validate string using regular expressions.
     """
+    pure = True
 
-    def __init__(self, pattern, flags=0, **kwargs):
+    def __init__(self, pattern, flags=0, match='search', **kwargs):
+        """
+        match is the method used to match the data: 'search' (anywhere in
+        the data), 'match' (at the beginning) or 'fullmatch' (all the data)
+        """
         super(Regex, self).__init__(**kwargs)
+        if match not in ('search', 'match', 'fullmatch'):
+            raise ValueError('match must be "search", "match" or "fullmatch",'
+                ' got %r' % (match,))
+        regex_lib = self.options.get('regex_lib')
+        if regex_lib is None:
+            import re as regex_lib
+        def compile(pattern):
+            # some libs (like re2) do not support flags
+            if flags: return regex_lib.compile(pattern, flags=flags)
+            return regex_lib.compile(pattern)
         if hasattr(pattern, 'search'):
             self._pattern = pattern
+        else: self._pattern = compile(pattern)
+        self._mode = match
+        # libs without match or fullmatch get an anchored pattern, searched
+        if hasattr(self._pattern, match):
+            self._match = getattr(self._pattern, match)
         else:
-            regex_lib = self.options.get('regex_lib', re)
-            self._pattern = regex_lib.compile(pattern, flags=flags)
+            # the end of the data is \z in re2 (and re from Python 3.14),
+            # \Z in re
+            ends = (r'\z', r'\Z') if match == 'fullmatch' else ('',)
+            error = getattr(regex_lib, 'error', ValueError)
+            for end in ends:
+                try:
+                    anchored = compile(r'\A(?:%s)%s' % (self._pattern.pattern, end))
+                    break
+                except error:
+                    if end == ends[-1]: raise
+            self._match = anchored.search
+        # the types that can be matched
+        pattern_type = type(getattr(self._pattern, 'pattern', None))
+        if issubclass(pattern_type, (basestring, bytes)):
+            self._types = pattern_type
+        else: self._types = (basestring, bytes)
 
     def __repr__(self):
-        return "%s(%r)" % (self.__class__.__name__, self._pattern)
+        if self._mode == 'search':
+            return "%s(%r)" % (self.__class__.__name__, self._pattern)
+        return "%s(%r, match=%r)" % (self.__class__.__name__, self._pattern,
+            self._mode)
 
     def validate(self, data):
         """
@@ -561,18 +1373,32 @@ class Regex(BaseSchema):
         :param data: data to be validated
         :return: return validated data.
         """
-        e = self._error
+        if not isinstance(data, self._types):
+            raise SchemaError("%s is not string nor buffer" % _repr(data),
+                self._error)
+        if self._match(data):
+            return data
+        raise SchemaError("%r does not match %s" % (self, _repr(data)),
+            self._error)
 
-        try:
-            if self._pattern.search(data):
-                return data
-            else:
-                raise SchemaError("%r does not match %r" % (self, data), e)
-        except TypeError:
-            raise SchemaError("%r is not string nor buffer" % data, e)
+    def validate_many(self, data):
+        """
+        Validates an iterable of strings with the same compiled pattern.
+        :param data: the strings to be validated
+        :return: a list of the validated strings
+        """
+        data = list(data)
+        match, types = self._match, self._types
+        for item in data:
+            if not isinstance(item, types) or not match(item):
+                self.validate(item)
+        return data
 
     def keys(self, item, comparable_keys, type_keys, global_keys):
-        type_keys.setdefault(basestring, []).append(item)
+        if isinstance(self._types, tuple):
+            for t in self._types:
+                type_keys.setdefault(t, []).append(item)
+        else: type_keys.setdefault(self._types, []).append(item)
 
     def json_schema(self, schema_id=None, **kwargs):
         """
@@ -580,8 +1406,11 @@ class Regex(BaseSchema):
         """
         if hasattr(self, '_json_schema'):
             return self._json_schema_aux(schema_id, self._json_schema)
+        pattern = self._pattern.pattern
+        if self._mode == 'match': pattern = '^(?:%s)' % pattern
+        elif self._mode == 'fullmatch': pattern = '^(?:%s)$' % pattern
         return self._json_schema_aux(schema_id, dict(
-            type='string', regex=self._pattern.pattern))
+            type='string', regex=pattern))
 
 
 @schema_class('use')
@@ -591,11 +1420,16 @@ class Use(BaseSchema):
     the data while it is being validate.
     """
 
-    def __init__(self, callable_, **kwargs):
+    def __init__(self, callable_, pure=False, **kwargs):
+        """
+        pure tells if callable_ has no side effect and always returns the same
+        result for the same data, so its result can be cached
+        """
         super(Use, self).__init__(**kwargs)
         if not callable(callable_):
             raise TypeError("Expected a callable, not %r" % callable_)
         self._callable = callable_
+        self.pure = pure
 
     def __repr__(self):
         return "%s(%r)" % (self.__class__.__name__, self._callable)
@@ -608,10 +1442,38 @@ class Use(BaseSchema):
             raise x
         except BaseException as x:
             f = _callable_str(self._callable)
-            raise SchemaError("%s(%r) raised %r" % (f, data, x), self._error.format(data) if self._error else None)
+            raise SchemaError("%s(%s) raised %r" % (f, _repr(data), x), self._error.format(data) if self._error else None)
 
+    @property
+    def _awaits(self):
+        # the classes (like int) and the builtins do not return awaitables
+        f = self._callable
+        if isinstance(f, type): return hasattr(f, '__await__')
+        import types
+        return not isinstance(f, (types.BuiltinFunctionType,
+            types.MethodDescriptorType, types.WrapperDescriptorType,
+            types.MethodWrapperType))
+
+    async def validate_async(self, data, limit=None):
+        """
+        Awaits the result of the callable if needed
+        """
+        limit = _semaphore(limit)
+        try:
+            result = self._callable(data)
+            if _isawaitable(result):
+                if limit is None: result = await result
+                else:
+                    async with limit: result = await result
+            return result
+        except SchemaError as x:
+            x.prepend(None, self._error.format(data) if self._error else None)
+            raise x
+        # do not catch the cancellation of the task
+        except Exception as x:
+            f = _callable_str(self._callable)
+            raise SchemaError("%s(%s) raised %r" % (f, _repr(data), x), self._error.format(data) if self._error else None)
 
-COMPARABLE, CALLABLE, VALIDATOR, TYPE, DICT, ITERABLE = range(10, 70, 10)
 
 def _priority(s):
     """Return priority for a given object."""
@@ -635,6 +1497,7 @@ class Any(BaseSchema):
     Always validates any data, equivalend to `object`
     """
     priority = 100
+    pure = True
 
     def validate(self, data):
         return data
@@ -656,14 +1519,25 @@ class Dict(BaseSchema):
     priority = DICT
 
     def __init__(self, schemas, error=None,
-            min_length=0, max_length=float('inf'), length=None, **kwargs):
+            min_length=0, max_length=float('inf'), length=None, into=None,
+            **kwargs):
         """
         schemas can be a dict or a iterable over couples
         min_length, max_length and length control the size of the dict
+        into is None to return a dict of the type of the data, or 'tuple' or
+        a class (like a namedtuple or a class with __slots__) to return a
+        record built with the values in the order of the keys (None for the
+        missing optional keys), the keys must be constants
         """
         super(Dict, self).__init__(error=error, **kwargs)
+        if into == 'tuple': into = tuple
+        elif into is not None and not callable(into):
+            raise ValueError('into must be None, "tuple" or a class, got %r'
+                % (into,))
+        self._into = into
         # save ignore_extra_keys
         self._ignore_extra_keys = self.options.get('ignore_extra_keys', False)
+        self._strict = self.options.get('strict', False)
         # save min_length and max_length
         if length is not None:
             self._min_length = length
@@ -679,6 +1553,12 @@ class Dict(BaseSchema):
         priorities = {} # the priority of each key
         self._required = set() # all the required keys
         self._default = set() # all the keys with a default value
+        self._bits = {} # the bit of the required keys and the default keys
+        self._required_bits = 0 # the bits of all the required keys
+        self._default_bits = 0 # the bits of all the keys with a default value
+        self._default_template = {} # the constant default values
+        self._default_constants = [] # the (key, bit, value) constant defaults
+        self._default_factories = [] # the (key, bit, factory, args) defaults
         self._reset = [] # all the keys with a reset function
         self._schemas = {} # for display
         self._all_keys = [] # for json_shcema
@@ -707,11 +1587,20 @@ class Dict(BaseSchema):
             else: priority = flavor
             priorities[key] = priority
             # check for required
-            if getattr(key, 'required', True):
+            required = getattr(key, 'required', True)
+            if required:
                 self._required.add(key)
             # check for default
-            if hasattr(key, 'default'):
+            default = hasattr(key, 'default')
+            if default:
                 self._default.add(key)
+            # the keys seen are tracked with one bit per key
+            if (required or default) and key not in self._bits:
+                bit = self._bits[key] = 1 << len(self._bits)
+                if required: self._required_bits |= bit
+                if default:
+                    self._default_bits |= bit
+                    self._add_default(key, bit)
             # check for reset function
             if hasattr(key, 'reset'):
                 self._reset.append(key)
@@ -733,7 +1622,9 @@ class Dict(BaseSchema):
                 key=sortkey)
         # for each comparable key, add the first type keys, or the global keys
         self._comparable_keys = {}
+        direct = {} # the key schemas matched by the lookup of each key
         for key, items in comparable_keys.items():
+            direct[key] = {skey for skey, _ in items if self._is_direct(skey)}
             for t in type(key).__mro__:
                 if t not in self._type_keys: continue
                 items.extend(self._type_keys[t])
@@ -743,71 +1634,311 @@ class Dict(BaseSchema):
             self._comparable_keys[key] = sorted((item for item in items
                 if item[0] not in seen and not seen.add(item[0])),
                 key=sortkey)
+        # the tables contain (key schema, value schema, direct, bit) tuples
+        # a direct key schema does not need to validate the key when found in
+        # _comparable_keys, the lookup has already compared them
+        bits = self._bits
+        self._global_keys = [(skey, svalue, False, bits.get(skey, 0))
+            for skey, svalue in self._global_keys]
+        for key, items in self._type_keys.items():
+            self._type_keys[key] = [(skey, svalue, False, bits.get(skey, 0))
+                for skey, svalue in items]
+        for key, items in self._comparable_keys.items():
+            self._comparable_keys[key] = [(skey, svalue, skey in direct[key],
+                bits.get(skey, 0)) for skey, svalue in items]
+        self._lookups = None
+        if self._ignore_extra_keys: self._lookups = self._lookups_of()
+        # the records are built from the values of the constant keys
+        if into is not None:
+            self._fields = self._lookups_of(any_key=True)
+            if self._fields is None:
+                raise ValueError('into needs constant keys, without hooks '
+                    'other than Optional, got %r' % (self._schemas,))
+            self._record_template = [self._default_template.get(key)
+                for key, _, _ in self._fields]
+            positions = {key: i for i, (key, _, _) in enumerate(self._fields)}
+            self._record_factories = [(positions[key], bit, factory, args)
+                for key, bit, factory, args in self._default_factories]
+        # the keys of the data can be matched without their values
+        self._viewable = into is None and not self._reset and all(
+            type(skey) in (Schema, Optional) and 'handle' not in vars(skey)
+            and not skey._only_one for skey, _ in self._all_keys)
+
+    def _lookups_of(self, any_key=False):
+        """
+        Returns the (key, value schema, bit) to look up in the data when all
+        the keys are plain strings (or any constant if any_key), so that the
+        keys of the data do not need to be matched, or None
+        """
+        if self._global_keys or self._type_keys or self._reset: return None
+        lookups = []
+        for key, items in self._comparable_keys.items():
+            if len(items) != 1: return None
+            # the key of the data is returned, it must be the same
+            if not any_key and type(key) not in (str, bytes): return None
+            (skey, svalue, direct, bit), = items
+            # the hooks must save the matching values and raise the errors
+            if not direct or skey._only_one or \
+                type(skey) not in (Schema, Optional) or 'handle' in vars(skey):
+                return None
+            lookups.append((key, svalue, bit))
+        return tuple(lookups)
+
+    def _validate_into(self, data):
+        """
+        Validates data by looking up each key of the schema, and returns a
+        record, see the into parameter
+        """
+        values = list(self._record_template)
+        coverage = 0 # the bits of the keys seen
+        found = 0 # the number of keys found
+        get, marker = data.get, self._MARKER
+        for i, (key, svalue, bit) in enumerate(self._fields):
+            value = get(key, marker)
+            if value is marker: continue
+            found += 1
+            try:
+                values[i] = svalue.validate(value)
+            except SchemaError as x:
+                message = self._prepend_schema_name("Key '%s' error:" % key)
+                x.prepend(message, self._error)
+                raise x
+            coverage |= bit
+        # raises the errors of the missing keys and the extra keys
+        if coverage & self._required_bits != self._required_bits or \
+                (found < len(data) and not self._ignore_extra_keys):
+            fields = self._comparable_keys
+            self._finish(data, {}, coverage,
+                [key for key in data if key not in fields])
+        missing = self._default_bits & ~coverage
+        # the constant defaults are in the template
+        if missing:
+            for i, bit, factory, args in self._record_factories:
+                if missing & bit: values[i] = factory(*args)
+        into = self._into
+        return tuple(values) if into is tuple else into(*values)
+
+    def _record(self, new):
+        """
+        Returns the record of the values of a validated dict
+        """
+        values = [new.get(key) for key, _, _ in self._fields]
+        into = self._into
+        return tuple(values) if into is tuple else into(*values)
+
+    def _validate_lookups(self, data):
+        """
+        Validates data by looking up each key of the schema, see _lookups_of
+        """
+        new = self._new(data) # the data to return
+        coverage = 0 # the bits of the keys seen
+        get, marker = data.get, self._MARKER
+        for key, svalue, bit in self._lookups:
+            value = get(key, marker)
+            if value is marker: continue
+            try:
+                new[key] = svalue.validate(value)
+            except SchemaError as x:
+                message = self._prepend_schema_name("Key '%s' error:" % key)
+                x.prepend(message, self._error)
+                raise x
+            coverage |= bit
+        return self._finish(data, new, coverage, ())
+
+    def _add_default(self, skey, bit):
+        """
+        Precomputes how the default value of a key schema is added
+        """
+        key, default = skey._schema, skey.default
+        copy_default = getattr(skey, 'copy_default', False)
+        if callable(default):
+            self._default_factories.append((key, bit, default, ()))
+        elif copy_default:
+            self._default_factories.append(
+                (key, bit, self._copier(default), (default,)))
+        else:
+            self._default_template[key] = default
+            self._default_constants.append((key, bit, default))
+
+    @staticmethod
+    def _copier(value):
+        """
+        Returns the function copying value: a shallow copy for the lists,
+        dicts and sets of immutable values, else a deep copy
+        """
+        atomic = (type(None), bool, int, float, complex, str, bytes)
+        if type(value) in (list, set) and \
+                all(type(item) in atomic for item in value):
+            return type(value)
+        if type(value) is dict and \
+                all(type(item) in atomic for item in value.values()):
+            return dict
+        import copy
+        return copy.deepcopy
+
+    @staticmethod
+    def _is_mapping(data):
+        from collections.abc import Mapping
+        return isinstance(data, Mapping)
+
+    @staticmethod
+    def _is_direct(skey):
+        """
+        Returns whether the key schema only compares the key to a constant
+        """
+        return isinstance(skey, Schema) and skey._flavor == COMPARABLE and \
+            type(skey).validate is Schema.validate and skey.stats is None
 
     def __repr__(self):
         return "%s(%r)" % (self.__class__.__name__, self._schemas)
 
+    @property
+    def pure(self):
+        return not self._reset and all(key.pure and schema.pure
+            for key, schema in self._all_keys)
+
     def validate(self, data):
         """
         Validates a dict.
         Check each key and value, call the hooks if needed, check for required
         keys and default values
         """
-        # check that this is a dict
-        if not isinstance(data, dict):
-            message = "%r should be instance of dict" % (data)
-            self._raise_error(message, data, SchemaUnexpectedTypeError)
-        # check the length
-        if not self._min_length <= len(data) <= self._max_length:
-            message = "%r should have a length between %s and %s (is %s)" % (data, self._min_length, self._max_length, len(data))
-            self._raise_error(message, data, SchemaWrongLengthError)
+        self._check(data)
+        if self._into is not None: return self._validate_into(data)
+        if self._lookups is not None: return self._validate_lookups(data)
 
-        e = self._error
-        exitstack = ExitStack()
-        new = type(data)() # the data to return
-        coverage = set() # which keys have been seen
+        return self._validate_items(data, self._items(data))
+
+    def _validate_items(self, data, data_items, changes=None, previous=None):
+        """
+        Validates the keys and values of data_items, the items of data
+        Check each key and value, call the hooks if needed, check for required
+        keys and default values
+        With previous (see validate_incremental), the values of the keys not
+        in changes are taken from previous
+        """
+        new = self._new(data) # the data to return
         wrong_keys = [] # which keys are extra
-        # call reset of all keys once finished
-        for skey in self._reset:
-            exitstack.callback(skey.reset)
-
-        with exitstack:
-            # treat the simple values first
-            data_items = sorted(data.items(),
-                key=lambda value: isinstance(value[1],
-                    (dict, list, tuple, set, frozenset)))
-            for key, value in data_items:
-                # look for the best list of schemas
-                sitems = self._comparable_keys.get(key, None)
-                if sitems is None:
-                    for t in type(key).__mro__:
-                        sitems = self._type_keys.get(t, None)
-                        if sitems is not None: break
-                    else: sitems = self._global_keys
-
-                for skey, svalue in sitems:
-                    # check if the key schema matches the key
+        only_one = set() # which only_one conditions have matched a key
+        try:
+            coverage = self._match_items(data, data_items, new, wrong_keys,
+                only_one, changes, previous)
+        finally:
+            # call reset of all keys once finished
+            for skey in self._reset: skey.reset()
+        return self._finish(data, new, coverage, wrong_keys)
+
+    def _match_items(self, data, data_items, new, wrong_keys, only_one,
+            changes=None, previous=None):
+        """
+        Validates the keys and values of data_items in new, see
+        _validate_items
+        Returns the bits of the keys seen
+        """
+        coverage = 0 # the bits of the keys seen
+        for key, value in data_items:
+            # look for the best list of schemas
+            for skey, svalue, direct, bit in self._key_schemas(key):
+                # check if the key schema matches the key
+                if direct: nkey = key
+                else:
                     try:
                         nkey = skey.validate(key)
                     except SchemaError:
                         continue
-                    # check if the value schema matches the value
+                if skey._only_one: self._match_only_one(skey, only_one)
+                # check if the value schema matches the value
+                try:
+                    if previous is None: nvalue = svalue.validate(value)
+                    # the unchanged values are reused
+                    elif key not in changes and nkey in previous:
+                        nvalue = previous[nkey]
+                    elif changes.get(key) is not None and nkey in previous:
+                        nvalue = svalue._validate_incremental(value,
+                            changes[key], previous[nkey])
+                    else: nvalue = svalue.validate(value)
+                # it doesn't match, try to call catch, else continue
+                except SchemaError as x:
+                    if hasattr(skey, 'catch'):
+                        action = skey.catch(nkey, x, new, data)
+                    else: action = True
+                    if action is True: raise self._key_error(nkey, x)
+                    elif action is False: break
+                # it matches, try to call handle, else sve the key/value
+                else:
+                    coverage |= bit
+                    if hasattr(skey, 'handle'):
+                        action = skey.handle(nkey, nvalue, new, data)
+                    else: action = True
+                    if action is True:
+                        new[nkey] = nvalue
+                        break
+                    elif action is False: break
+            # no key has matched
+            else: wrong_keys.append(key)
+        return coverage
+
+    def _key_schemas(self, key):
+        """
+        Returns the (key schema, value schema, direct, bit) that can match
+        key, in order
+        """
+        sitems = self._comparable_keys.get(key, None)
+        if sitems is not None: return sitems
+        for t in type(key).__mro__:
+            sitems = self._type_keys.get(t, None)
+            if sitems is not None: return sitems
+        return self._global_keys
+
+    def _match_key(self, key):
+        """
+        Returns the validated key, the value schema and the bit of the first
+        key schema matching key, or None, for the dicts without hooks (see
+        _viewable)
+        """
+        for skey, svalue, direct, bit in self._key_schemas(key):
+            if direct: return key, svalue, bit
+            try: return skey.validate(key), svalue, bit
+            except SchemaError: continue
+        return None
+
+    def _key_error(self, nkey, x):
+        """
+        Returns the error x of the value of nkey, prefixed with the key
+        """
+        message = self._prepend_schema_name("Key '%s' error:" % nkey)
+        x.prepend(message, self._error)
+        return x
+
+    @_steps_for(validate, nested=True)
+    def _steps(self, data):
+        self._check(data)
+        new = self._new(data) # the data to return
+        coverage = 0 # the bits of the keys seen
+        wrong_keys = [] # which keys are extra
+        only_one = set() # which only_one conditions have matched a key
+        try:
+            data_items = self._items(data)
+            # the values are yielded, see _validate_items
+            for key, value in data_items:
+                for skey, svalue, direct, bit in self._key_schemas(key):
+                    if direct: nkey = key
+                    else:
+                        try:
+                            nkey = skey.validate(key)
+                        except SchemaError:
+                            continue
+                    if skey._only_one: self._match_only_one(skey, only_one)
                     try:
-                        nvalue = svalue.validate(value)
-                    # it doesn't match, try to call catch, else continue
+                        nvalue = yield svalue, value
                     except SchemaError as x:
                         if hasattr(skey, 'catch'):
                             action = skey.catch(nkey, x, new, data)
                         else: action = True
-                        if action is True:
-                            message = "Key '%s' error:" % nkey
-                            message = self._prepend_schema_name(message)
-                            x.prepend(message, e)
-                            raise x
+                        if action is True: raise self._key_error(nkey, x)
                         elif action is False: break
-                    # it matches, try to call handle, else sve the key/value
                     else:
-                        coverage.add(skey)
+                        coverage |= bit
                         if hasattr(skey, 'handle'):
                             action = skey.handle(nkey, nvalue, new, data)
                         else: action = True
@@ -815,45 +1946,350 @@ class Dict(BaseSchema):
                             new[nkey] = nvalue
                             break
                         elif action is False: break
-                # no key has matched
                 else: wrong_keys.append(key)
-        # check that all required keys have been seen
-        if not self._required <= coverage:
-            missing_keys = self._required - coverage
-            s_missing_keys = ", ".join(repr(self._key_names.get(k, k)) \
-                for k in sorted(missing_keys, key=repr))
-            message = "Missing key%s: %s" % (_plural_s(missing_keys), s_missing_keys)
-            self._raise_error(message, data, SchemaMissingKeyError)
-        # check if extra keys are authorized
-        if not self._ignore_extra_keys and wrong_keys:
-            s_wrong_keys = ", ".join(repr(k) for k in sorted(wrong_keys, key=repr))
-            message = "Wrong key%s %s in %r" % \
-                (_plural_s(wrong_keys), s_wrong_keys, data)
-            self._raise_error(message, data, SchemaWrongKeyError)
-        # get the default value of all unseen keys
-        for skey in self._default - coverage:
-            default = skey.default
-            if callable(default):
-                new[skey._schema] = default()
-            else: new[skey._schema] = default
+        finally:
+            # call reset of all keys once finished
+            for skey in self._reset: skey.reset()
+        return self._finish(data, new, coverage, wrong_keys)
 
-        return new
+    async def validate_async(self, data, limit=None):
+        """
+        Validates a dict asynchronously, the values that may await are
+        validated concurrently, the other ones synchronously
+        """
+        limit = _semaphore(limit)
+        if not self._may_await: return type(self).validate(self, data)
+        self._check(data)
+        new = self._new(data) # the data to return
+        wrong_keys = [] # which keys are extra
+        only_one = set() # which only_one conditions have matched a key
+        try:
+            items, awaited = [], []
+            for item in self._items(data):
+                if self._key_awaits(item[0]): awaited.append(item)
+                else: items.append(item)
+            coverage = self._match_items(data, items, new, wrong_keys,
+                only_one)
+            for bit in await _gather(self._validate_item_async(key, value,
+                    new, data, wrong_keys, only_one, limit)
+                    for key, value in awaited):
+                coverage |= bit
+        finally:
+            # call reset of all keys once finished
+            for skey in self._reset: skey.reset()
+        return self._finish(data, new, coverage, wrong_keys)
+
+    def _key_awaits(self, key):
+        """
+        Returns whether the validation of key and its value may await
+        """
+        return any(skey._may_await or svalue._may_await
+            for skey, svalue, _, _ in self._key_schemas(key))
 
-    def json_schema(self, schema_id=None, **kwargs):
+    @property
+    def _awaits(self):
+        return any(skey._awaits or svalue._awaits
+            for skey, svalue in self._all_keys)
+
+    async def _validate_item_async(self, key, value, new, data,
+            wrong_keys, only_one, limit):
         """
-        Generates a JSON schema for this object.
-        Creates a 'properties' field for comparable keys.
-        Creates a 'patternProperties' field for regex keys.
-        Creates a 'additionalProperties' field for other keys.
-        Several identical keys are merged together.
+        Validates a key and its value asynchronously, see _validate_items
+        Returns the bit of the matched key schema
         """
-        if hasattr(self, '_json_schema'):
-            return self._json_schema_aux(schema_id, self._json_schema)
+        seen = 0 # the bit of the matched key schema
+        for skey, svalue, direct, bit in self._key_schemas(key):
+            if direct: nkey = key
+            else:
+                try:
+                    nkey = skey.validate(key)
+                except SchemaError:
+                    continue
+            if skey._only_one: self._match_only_one(skey, only_one)
+            try:
+                nvalue = await svalue.validate_async(value, limit)
+            except SchemaError as x:
+                if hasattr(skey, 'catch'):
+                    action = await _await(skey.catch(nkey, x, new, data))
+                else: action = True
+                if action is True: raise self._key_error(nkey, x)
+                elif action is False: break
+            else:
+                seen |= bit
+                if hasattr(skey, 'handle'):
+                    action = await _await(skey.handle(nkey, nvalue, new, data))
+                else: action = True
+                if action is True:
+                    new[nkey] = nvalue
+                    break
+                elif action is False: break
+        else: wrong_keys.append(key)
+        return seen
 
-        props = {} # a dict of list of tuples for properties
-        patternProps = {} # a dict of list of tuples for patternProperties
-        addProps = [] # a list of tuples for additionalProperties
-        requiredProps = set() # for required
+    def view(self, data):
+        """
+        Returns a read-only view of the dict, the keys are matched and
+        checked up front, the values are validated on first access
+        The dicts with hooks (except Optional) are validated
+        """
+        if not self._viewable: return self.validate(data)
+        self._check(data)
+        coverage = 0 # the bits of the keys seen
+        wrong_keys = [] # which keys are extra
+        pending = {} # the value schema and the value of each key
+        for key, value in data.items():
+            match = self._match_key(key)
+            if match is None:
+                wrong_keys.append(key)
+                continue
+            nkey, svalue, bit = match
+            coverage |= bit
+            pending[nkey] = (svalue, value)
+        values = self._finish(data, {}, coverage, wrong_keys)
+        if not _view_classes: _define_views()
+        return _view_classes[dict](self, values, pending)
+
+    def validate_rows(self, rows, header=None, errors=None, max_errors=100):
+        """
+        Validates rows of values (like the lists of strings of a csv.reader),
+        the columns being the keys. The key schema and the value schema of
+        each column are found once, from the header
+        Takes
+        - rows: an iterable of rows
+        - header: the keys of the columns (default: the first row)
+        - errors: a list collecting the (row number, SchemaError) of the
+            invalid rows, which are skipped, or None to raise the first error
+        - max_errors: the maximum number of errors collected, the next one
+            is raised
+        Yields the validated rows, dicts or records (see into)
+        The rows are numbered from 1, the header being the first one if it is
+        read from rows. The dicts with hooks (except Optional) validate the
+        dict of each row
+        """
+        rows = iter(rows)
+        number = 0 # the number of the current row
+        if header is None:
+            header = next(rows, None)
+            if header is None: return
+            number = 1
+        header = list(header)
+        width = len(header)
+        # the dicts with hooks validate a dict of each row
+        columns = None
+        if self._viewable or self._into is not None:
+            columns, keys, template, factories = self._columns(header)
+        into = self._into
+        for row in rows:
+            number += 1
+            try:
+                if len(row) != width:
+                    message = "Row has %d values, expected %d" % (len(row),
+                        width)
+                    self._raise_error(message, row, SchemaWrongLengthError)
+                if columns is None:
+                    yield self.validate(dict(zip(header, row)))
+                    continue
+                values = list(template)
+                for i, nkey, svalue, position in columns:
+                    try:
+                        values[position] = svalue.validate(row[i])
+                    except SchemaError as x:
+                        raise self._key_error(nkey, x)
+                for position, factory, args in factories:
+                    values[position] = factory(*args)
+                if into is tuple: yield tuple(values)
+                elif into is not None: yield into(*values)
+                else: yield dict(zip(keys, values))
+            except SchemaError as x:
+                x.prepend("Row %d error:" % number, None)
+                if errors is None or len(errors) >= max_errors: raise x
+                # the frames of the traceback would keep the rows alive
+                errors.append((number, x.with_traceback(None)))
+
+    def _columns(self, header):
+        """
+        Matches the keys of header, and checks its length and that all the
+        required keys are found, see validate_rows
+        Returns the (index, key, value schema, position) of the columns, the
+        keys and the template of the validated rows, and the (position,
+        factory, args) of the default values to build
+        """
+        # the dicts of the rows have the length of the header
+        length = len(dict.fromkeys(header))
+        if not self._min_length <= length <= self._max_length:
+            message = "%s should have a length between %s and %s (is %s)" % (_repr(header), self._min_length, self._max_length, length)
+            self._raise_error(message, header, SchemaWrongLengthError)
+        coverage = 0 # the bits of the keys found
+        wrong_keys = [] # which keys are extra
+        columns = [] # the (index, key, value schema) of the columns
+        for i, key in enumerate(header):
+            match = self._match_key(key)
+            if match is None:
+                wrong_keys.append(key)
+                continue
+            nkey, svalue, bit = match
+            coverage |= bit
+            columns.append((i, nkey, svalue))
+        # raises the errors of the missing keys and the extra keys
+        if coverage & self._required_bits != self._required_bits or \
+                (wrong_keys and not self._ignore_extra_keys):
+            self._finish(header, {}, coverage, wrong_keys)
+        missing = self._default_bits & ~coverage
+        factories = [(key, factory, args) for key, bit, factory, args
+            in self._default_factories if missing & bit]
+        if self._into is not None:
+            # the values are in the order of the record
+            positions = {key: i for i, (key, _, _) in enumerate(self._fields)}
+            keys = [key for key, _, _ in self._fields]
+            template = list(self._record_template)
+        else:
+            defaults = {key: value for key, bit, value
+                in self._default_constants if missing & bit}
+            keys = [nkey for _, nkey, _ in columns]
+            keys.extend(key for key, _, _ in factories)
+            keys.extend(defaults)
+            # a key can be in several columns, the last one is kept
+            keys = list(dict.fromkeys(keys))
+            positions = {key: i for i, key in enumerate(keys)}
+            template = [defaults.get(key) for key in keys]
+        return ([(i, nkey, svalue, positions[nkey])
+                for i, nkey, svalue in columns], keys, template,
+            [(positions[key], factory, args) for key, factory, args in factories])
+
+    def _project(self, selection):
+        """
+        Keeps the key schemas matching the selected keys, and projects their
+        value schemas. The keys that are not constants only match the
+        selected keys, and become optional
+        """
+        if selection is None: return self
+        items = []
+        for name, sub in selection.items():
+            found = len(items)
+            for skey, svalue, direct, bit in self._key_schemas(name):
+                # the plain keys and Optional save the value or raise
+                plain = type(skey) in (Schema, Optional) and \
+                    'handle' not in vars(skey)
+                if isinstance(skey, Schema) and skey._flavor == COMPARABLE:
+                    if not direct and not skey.is_valid(name): continue
+                    items.append((self._key_names.get(skey, skey),
+                        svalue._project(sub)))
+                elif plain and skey.is_valid(name):
+                    items.append((self._generate_cls('optional',
+                        self._generate_cls('and', name, skey)),
+                        svalue._project(sub)))
+                else: continue
+                if plain: break
+            if len(items) == found:
+                raise ValueError('%r matches no key of %r' % (name, self))
+        return self._generate_cls('dict', items, min_length=self._min_length,
+            max_length=self._max_length,
+            options=dict(self.options, ignore_extra_keys=True))
+
+    def _validate_incremental(self, data, changes, previous):
+        """
+        Validates a dict incrementally, the values of the unchanged keys are
+        taken from previous
+        """
+        if not isinstance(previous, dict): return self.validate(data)
+        self._check(data)
+        return self._validate_items(data, data.items(), changes, previous)
+
+    def _match_only_one(self, skey, only_one):
+        """
+        Checks that the only_one conditions of a matching key have not already
+        matched another key
+        """
+        for or_ in skey._only_one:
+            if or_ in only_one:
+                raise SchemaOnlyOneAllowedError(["There are multiple keys "
+                    "present from the %r condition" % or_])
+            only_one.add(or_)
+
+    def keys(self, item, comparable_keys, type_keys, global_keys):
+        if self._strict: type_keys.setdefault(dict, []).append(item)
+        else:
+            from collections.abc import Mapping
+            type_keys.setdefault(Mapping, []).append(item)
+
+    @staticmethod
+    def _new(data):
+        """
+        Returns the empty dict to fill, of the type of data if it is a dict
+        """
+        return type(data)() if isinstance(data, dict) else {}
+
+    @staticmethod
+    def _items(data):
+        """
+        Returns the items of data, the simple values first for a dict, the
+        other mappings are read once, lazily
+        """
+        if not isinstance(data, dict): return data.items()
+        return sorted(data.items(), key=lambda value: isinstance(value[1],
+            (dict, list, tuple, set, frozenset)))
+
+    def _check(self, data):
+        """
+        Checks the type and the length of data
+        """
+        # check that this is a dict, or another mapping if not strict
+        if not isinstance(data, dict) and (self._strict or
+                not self._is_mapping(data)):
+            message = "%s should be instance of dict" % _repr(data)
+            self._raise_error(message, data, SchemaUnexpectedTypeError)
+        # check the length
+        if not self._min_length <= len(data) <= self._max_length:
+            message = "%s should have a length between %s and %s (is %s)" % (_repr(data), self._min_length, self._max_length, len(data))
+            self._raise_error(message, data, SchemaWrongLengthError)
+
+    def _finish(self, data, new, coverage, wrong_keys):
+        """
+        Checks the required and the extra keys, and adds the default values
+        """
+        # check that all required keys have been seen
+        if coverage & self._required_bits != self._required_bits:
+            missing_keys = [skey for skey in self._required
+                if not coverage & self._bits[skey]]
+            s_missing_keys = ", ".join(repr(self._key_names.get(k, k)) \
+                for k in sorted(missing_keys, key=repr))
+            message = "Missing key%s: %s" % (_plural_s(missing_keys), s_missing_keys)
+            self._raise_error(message, data, SchemaMissingKeyError)
+        # check if extra keys are authorized
+        if not self._ignore_extra_keys and wrong_keys:
+            s_wrong_keys = ", ".join(repr(k) for k in sorted(wrong_keys, key=repr))
+            message = "Wrong key%s %s in %s" % \
+                (_plural_s(wrong_keys), s_wrong_keys, _repr(data))
+            self._raise_error(message, data, SchemaWrongKeyError)
+        # add the default values of all unseen keys
+        missing = self._default_bits & ~coverage
+        if missing:
+            if missing == self._default_bits:
+                new.update(self._default_template)
+            else:
+                for key, bit, value in self._default_constants:
+                    if missing & bit: new[key] = value
+            for key, bit, factory, args in self._default_factories:
+                if missing & bit: new[key] = factory(*args)
+
+        if self._into is not None: return self._record(new)
+        return new
+
+    def json_schema(self, schema_id=None, **kwargs):
+        """
+        Generates a JSON schema for this object.
+        Creates a 'properties' field for comparable keys.
+        Creates a 'patternProperties' field for regex keys.
+        Creates a 'additionalProperties' field for other keys.
+        Several identical keys are merged together.
+        """
+        if hasattr(self, '_json_schema'):
+            return self._json_schema_aux(schema_id, self._json_schema)
+
+        props = {} # a dict of list of tuples for properties
+        patternProps = {} # a dict of list of tuples for patternProperties
+        addProps = [] # a list of tuples for additionalProperties
+        requiredProps = set() # for required
 
         for key, schema in self._all_keys:
             key_dict = key.json_schema(**kwargs)
@@ -987,6 +2423,100 @@ class Dict(BaseSchema):
         else: return {'allOf': [anyOf], 'not': notAnyOf}
 
 
+@schema_class('object')
+class Object(BaseSchema):
+    """
+    Represents an object with attributes, like a dataclass or an attrs class
+    """
+    priority = DICT
+
+    def __init__(self, cls, schemas, as_dict=False, **kwargs):
+        """
+        Takes
+        - cls: the class of the objects, or None for any object
+        - schemas: the schema of each attribute, like the keys and the values
+            of a Dict (the keys must be names, optional with Optional)
+        - as_dict: returns a dict of the validated attributes instead of the
+            object (the object itself if no attribute is transformed, else a
+            copy with the validated attributes)
+        """
+        super(Object, self).__init__(**kwargs)
+        from operator import attrgetter
+        self._cls = cls
+        self._as_dict = as_dict
+        # the keys, the required keys and the defaults of Dict are used
+        self._dict = self._generate_cls('dict', schemas,
+            options=dict(self.options, ignore_extra_keys=True))
+        fields = self._dict._lookups_of()
+        if fields is None:
+            raise ValueError('Object needs attribute names, without hooks '
+                'other than Optional, got %r' % (schemas,))
+        self._attributes = tuple((name, attrgetter(name), svalue, bit)
+            for name, svalue, bit in fields)
+
+    def __repr__(self):
+        return "%s(%r, %r)" % (self.__class__.__name__, self._cls,
+            self._dict._schemas)
+
+    @property
+    def pure(self):
+        return self._dict.pure
+
+    def validate(self, data):
+        """
+        Validates the attributes of the object
+        """
+        if self._cls is not None and not isinstance(data, self._cls):
+            message = "%s should be instance of %r" % (_repr(data),
+                self._cls.__name__)
+            return self._raise_error(message, data, SchemaUnexpectedTypeError)
+        values = {} # the validated attributes
+        coverage = 0 # the bits of the attributes seen
+        changed = False # if an attribute is transformed
+        for name, getter, svalue, bit in self._attributes:
+            try: value = getter(data)
+            except AttributeError: continue
+            try:
+                values[name] = nvalue = svalue.validate(value)
+            except SchemaError as x:
+                message = "Attribute '%s' error:" % name
+                x.prepend(self._prepend_schema_name(message), self._error)
+                raise x
+            coverage |= bit
+            changed = changed or not _same(value, nvalue)
+        schema = self._dict
+        if coverage & schema._required_bits != schema._required_bits:
+            missing = [name for name, _, _, bit in self._attributes
+                if bit & schema._required_bits and not coverage & bit]
+            message = "Missing attribute%s: %s" % (_plural_s(missing),
+                ", ".join(repr(name) for name in missing))
+            self._raise_error(message, data, SchemaMissingKeyError)
+        # the defaults of the missing attributes
+        if schema._default_bits & ~coverage:
+            values = schema._finish(data, values, coverage, ())
+            changed = True
+        if self._as_dict: return values
+        if not changed: return data
+        import copy
+        new = copy.copy(data)
+        # frozen dataclasses and attrs classes too
+        for name, value in values.items(): object.__setattr__(new, name, value)
+        return new
+
+    def keys(self, item, comparable_keys, type_keys, global_keys):
+        if self._cls is None: global_keys.append(item)
+        else: type_keys.setdefault(self._cls, []).append(item)
+
+    def json_schema(self, schema_id=None, **kwargs):
+        """
+        Generates the JSON schema of an object with the attributes
+        """
+        if hasattr(self, '_json_schema'):
+            return self._json_schema_aux(schema_id, self._json_schema)
+        return self._json_schema_aux(schema_id,
+            self._dict.json_schema(**kwargs))
+
+
 @schema_class('list')
 class List(BaseSchema):
     """
@@ -995,13 +2525,26 @@ class List(BaseSchema):
     priority = ITERABLE
 
     def __init__(self, schema, *args,
-        min_length=0, max_length=float('inf'), length=None, **kwargs):
+        min_length=0, max_length=float('inf'), length=None,
+        sample=None, sample_size=None, seed=0, **kwargs):
         """
         If passed a list/tuple/set/forzenset, matches only this type.
         If passed a multiple values, matches any iterable type
         min_length, max_length and length control the size of the dict
+        sample (a fraction of the items) and sample_size (a number of items)
+        only validate a random sample of the lists and tuples, plus their
+        first and last items, see sampled_indices
+        seed makes the sample deterministic
         """
         super(List, self).__init__(**kwargs)
+        if sample is not None and not 0 < sample <= 1:
+            raise ValueError('sample must be between 0 and 1, got %r' % sample)
+        if sample_size is not None and sample_size < 0:
+            raise ValueError('sample_size must be positive, got %r'
+                % sample_size)
+        self._sample = sample
+        self._sample_size = sample_size
+        self._seed = seed
         if isinstance(schema, (list, tuple, set, frozenset)):
             self._type = type(schema)
             if len(schema) == 1:
@@ -1025,21 +2568,159 @@ class List(BaseSchema):
     def __repr__(self):
         return "%s(%r)" % (self.__class__.__name__, self._schema)
 
+    @property
+    def pure(self):
+        return self._schema.pure
+
+    @property
+    def _awaits(self):
+        return self._schema._awaits
+
     def validate(self, data):
         """
         Validates the list, by checking its type, its length and its items
+        When sampled, the list is returned as is if the sample is valid, else
+        it is fully validated
+        """
+        self._check(data)
+        schema = self._schema
+        indices = self._sampled(data)
+        if indices is not None:
+            try:
+                for i in indices: schema.validate(data[i])
+                return data
+            # the full validation raises the error
+            except SchemaError: pass
+        return type(data)(schema.validate(item) for item in data)
+
+    async def validate_async(self, data, limit=None):
+        """
+        Validates the list asynchronously, the items are validated concurrently
+        if they may await, else synchronously
+        """
+        limit = _semaphore(limit)
+        if not self._may_await: return type(self).validate(self, data)
+        self._check(data)
+        schema = self._schema
+        indices = self._sampled(data)
+        if indices is not None:
+            try:
+                await _gather(schema.validate_async(data[i], limit)
+                    for i in indices)
+                return data
+            except SchemaError: pass
+        return type(data)(await _gather(schema.validate_async(item, limit)
+            for item in data))
+
+    @_steps_for(validate, nested=True)
+    def _steps(self, data):
+        self._check(data)
+        schema = self._schema
+        indices = self._sampled(data)
+        if indices is not None:
+            try:
+                for i in indices: yield schema, data[i]
+                return data
+            except SchemaError: pass
+        items = []
+        for item in data:
+            items.append((yield schema, item))
+        return type(data)(items)
+
+    def view(self, data):
+        """
+        Returns a read-only view of the list or the tuple, its type and its
+        length are checked up front, the items are validated on first access
+        """
+        self._check(data)
+        if not isinstance(data, (list, tuple)): return self.validate(data)
+        if not _view_classes: _define_views()
+        return _view_classes[list](self._schema, data)
+
+    def _project(self, selection):
+        """
+        Projects the schema of the items on the selection of '[]'
+        """
+        if not selection: return self
+        if list(selection) != ['[]']:
+            raise ValueError('%r matches no key of %r, the items are '
+                'selected with "[]"' % (next(k for k in selection if k != '[]'),
+                self))
+        schema = self._schema._project(selection['[]'])
+        if schema is self._schema: return self
+        import copy
+        projected = copy.copy(self)
+        projected._schema = schema
+        return projected
+
+    def _validate_incremental(self, data, changes, previous):
+        """
+        Validates a list incrementally, the unchanged items are taken from
+        previous if the list has the same length
+        """
+        if self._sampled(data) is not None or \
+                not isinstance(data, (list, tuple)) or \
+                not isinstance(previous, (list, tuple)) or \
+                len(data) != len(previous):
+            return self.validate(data)
+        self._check(data)
+        # the indices of JSON pointers are strings
+        changes = {int(i) if isinstance(i, basestring) and i.isdigit() else i:
+            change for i, change in changes.items()}
+        schema = self._schema
+        items = list(previous)
+        for i, change in changes.items():
+            # an index out of the list
+            if not isinstance(i, int) or not -len(data) <= i < len(data):
+                return self.validate(data)
+            if change is None: items[i] = schema.validate(data[i])
+            else: items[i] = schema._validate_incremental(data[i], change,
+                previous[i])
+        return type(data)(items)
+
+    def sampled_indices(self, length):
+        """
+        Returns the sorted indices of the items validated in a list of length
+        items: the first one, the last one, and a random sample of the others
+        The sample only depends on the length and the seed
+        """
+        size = 0
+        if self._sample is not None:
+            import math
+            size = int(math.ceil(self._sample * length))
+        if self._sample_size is not None:
+            size = max(size, self._sample_size)
+        # too short to be sampled
+        if self._sample is None and self._sample_size is None or \
+                size + 2 >= length:
+            return list(range(length))
+        import random
+        sample = random.Random(self._seed).sample(range(1, length - 1), size)
+        return [0] + sorted(sample) + [length - 1]
+
+    def _sampled(self, data):
+        """
+        Returns the sampled indices of data, or None if it is fully validated
+        """
+        if self._sample is None and self._sample_size is None or \
+                not isinstance(data, (list, tuple)):
+            return None
+        indices = self.sampled_indices(len(data))
+        if len(indices) == len(data): return None
+        return indices
+
+    def _check(self, data):
+        """
+        Checks the type and the length of data
         """
         if not isinstance(data, self._type):
-            message = "%r should be instance of %r" % (data, self._type)
+            message = "%s should be instance of %r" % (_repr(data), self._type)
             self._raise_error(message, data, SchemaUnexpectedTypeError)
 
         if not self._min_length <= len(data) <= self._max_length:
-            message = "%r should have a length between %s and %s (is %s)" % (data, self._min_length, self._max_length, len(data))
+            message = "%s should have a length between %s and %s (is %s)" % (_repr(data), self._min_length, self._max_length, len(data))
             self._raise_error(message, data, SchemaWrongLengthError)
 
-        schema = self._schema
-        return type(data)(schema.validate(item) for item in data)
-
     def keys(self, item, comparable_keys, type_keys, global_keys):
         if type(self._type) is tuple:
             for t in self._type:
@@ -1087,10 +2768,31 @@ class Schema(BaseSchema):
 
         if hasattr(self._schema, 'reset') and not hasattr(self, 'reset'):
             self.reset = self._schema.reset
+        if isinstance(self._schema, BaseSchema) and self._schema._only_one:
+            self._only_one = self._schema._only_one
 
     def __repr__(self):
         return "%s(%r)" % (self.__class__.__name__, self._schema)
 
+    @property
+    def pure(self):
+        """
+        Types and comparables are pure, validators can tell if they are,
+        other callables are never considered as pure
+        """
+        if self._flavor == VALIDATOR:
+            return getattr(self._schema, 'pure', False)
+        return self._flavor in (COMPARABLE, TYPE)
+
+    @property
+    def _awaits(self):
+        # only the validators are validated asynchronously
+        if type(self).validate_async.__module__ != __name__: return True
+        if self._flavor != VALIDATOR: return False
+        schema = self._schema
+        if isinstance(schema, BaseSchema): return schema._awaits
+        return hasattr(schema, 'validate_async')
+
     def validate(self, data):
         """
         Validates the schema depending on its type
@@ -1106,7 +2808,7 @@ class Schema(BaseSchema):
                 x.prepend(None, e)
                 raise x
             except BaseException as x:
-                message = "%r.validate(%r) raised %r" % (schema, data, x)
+                message = "%r.validate(%s) raised %r" % (schema, _repr(data), x)
                 return self._raise_error(message, data)
         # types are matched
         elif flavor == TYPE:
@@ -1114,7 +2816,7 @@ class Schema(BaseSchema):
                 (isinstance(data, bool) and schema is int):
                     return data
             else:
-                message = "%r should be instance of %r" % (data, schema.__name__)
+                message = "%s should be instance of %r" % (_repr(data), schema.__name__)
                 return self._raise_error(message, data, SchemaUnexpectedTypeError)
         # callabled are called too
         elif flavor == CALLABLE:
@@ -1126,29 +2828,108 @@ class Schema(BaseSchema):
                 x.prepend(None, e)
                 raise x
             except BaseException as x:
-                message = "%s(%r) raised %r" % (f, data, x)
+                message = "%s(%s) raised %r" % (f, _repr(data), x)
                 return self._raise_error(message, data, SchemaError)
-            message = "%s(%r) should evaluate to True" % (f, data)
+            message = "%s(%s) should evaluate to True" % (f, _repr(data))
             return self._raise_error(message, data, SchemaError)
         # else it should be a comparable
         elif schema == data:
             return data
         else:
-            message = "%r does not match %r" % (schema, data)
+            message = "%r does not match %s" % (schema, _repr(data))
             return self._raise_error(message, data, SchemaError)
 
+    @_steps_for(validate)
+    def _steps(self, data):
+        if self._flavor != VALIDATOR:
+            return Schema.validate(self, data)
+        try:
+            return (yield self._schema, data)
+        except SchemaError as x:
+            x.prepend(None, self._error)
+            raise x
+        # do not catch the closing of the generator
+        except Exception as x:
+            message = "%r.validate(%s) raised %r" % (self._schema,
+                _repr(data), x)
+            return self._raise_error(message, data)
+
+    async def validate_async(self, data, limit=None):
+        """
+        Validates the schema asynchronously, only validators can be awaited
+        """
+        schema = self._schema
+        if self._flavor != VALIDATOR or not hasattr(schema, 'validate_async'):
+            return self.validate(data)
+        limit = _semaphore(limit)
+        try:
+            return await schema.validate_async(data, limit)
+        except SchemaError as x:
+            x.prepend(None, self._error)
+            raise x
+        # do not catch the cancellation of the task
+        except Exception as x:
+            message = "%r.validate(%s) raised %r" % (schema, _repr(data), x)
+            return self._raise_error(message, data)
+
+    def view(self, data):
+        schema = self._schema
+        # subclasses like Cached validate data differently
+        if self._flavor != VALIDATOR or \
+                type(self).validate is not Schema.validate or \
+                not hasattr(schema, 'view'):
+            return self.validate(data)
+        try:
+            return schema.view(data)
+        except SchemaError as x:
+            x.prepend(None, self._error)
+            raise x
+        except Exception as x:
+            message = "%r.validate(%s) raised %r" % (schema, _repr(data), x)
+            return self._raise_error(message, data)
+
+    def _project(self, selection):
+        schema = self._schema
+        # subclasses like Not validate data differently
+        if self._flavor != VALIDATOR or \
+                type(self).validate is not Schema.validate or \
+                not hasattr(schema, '_project'):
+            return self
+        projected = schema._project(selection)
+        if projected is schema: return self
+        return self._generate_cls('schema', projected)
+
+    def _validate_incremental(self, data, changes, previous):
+        schema = self._schema
+        # subclasses like Cached validate data differently
+        if self._flavor != VALIDATOR or \
+                type(self).validate is not Schema.validate or \
+                not hasattr(schema, '_validate_incremental'):
+            return self.validate(data)
+        try:
+            return schema._validate_incremental(data, changes, previous)
+        except SchemaError as x:
+            x.prepend(None, self._error)
+            raise x
+        except Exception as x:
+            message = "%r.validate(%s) raised %r" % (schema, _repr(data), x)
+            return self._raise_error(message, data)
+
     def keys(self, item, comparable_keys, type_keys, global_keys):
         """
         Puts item in the right structure depending on the type of schema
         """
         schema = self._schema
         flavor = self._flavor
-        if hasattr(schema, 'keys'):
+        # types and constants (like dict) can have a keys method too
+        if flavor == VALIDATOR and hasattr(schema, 'keys'):
             schema.keys(item, comparable_keys, type_keys, global_keys)
         elif flavor == TYPE:
             type_keys.setdefault(schema, []).append(item)
         elif flavor == COMPARABLE:
-            comparable_keys.setdefault(schema, []).append(item)
+            # the unhashable constants are compared with any data
+            try: comparable_keys.setdefault(schema, []).append(item)
+            except TypeError: global_keys.append(item)
         else: global_keys.append(item)
 
     def json_schema(self, schema_id=None, target=None, **kwargs):
@@ -1167,7 +2948,9 @@ class Schema(BaseSchema):
             schema_dict = schema.json_schema
             if callable(schema_dict):
                 schema_dict = schema_dict(target=target, **kwargs)
-            else: schema_dict = copy.deepcopy(schema_dict)
+            else:
+                import copy
+                schema_dict = copy.deepcopy(schema_dict)
         # types are converted to the right {'type': ...}
         if flavor == TYPE:
             if issubclass(schema, bool):
@@ -1211,6 +2994,21 @@ class Hook(Schema):
         self.required = required
         super(Hook, self).__init__(schema, **kwargs)
 
+    @property
+    def pure(self):
+        """
+        The handler of a hook can have side effects
+        """
+        return False
+
+    @property
+    def _awaits(self):
+        # the handlers given, or defined out of this module, may return
+        # awaitables
+        cls = type(self)
+        return 'handle' in vars(self) or cls.handle.__module__ != __name__ \
+            or cls.catch.__module__ != __name__
+
     def handle (self, key, value, new, data):
         """Called when both the key and the value are matched
         Takes:
@@ -1221,7 +3019,8 @@ class Hook(Schema):
         Returns:
         - None to continue the matching of the key
         - False to stop the matching of the key and discard it
-        - True to stop the matching of the key and save it"""
+        - True to stop the matching of the key and save it
+        When validating asynchronously, it can return an awaitable"""
         return None
 
     def catch (self, key, error, new, data):
@@ -1234,7 +3033,8 @@ class Hook(Schema):
         Returns:
         - None to continue the matching of the key
         - False to stop the matching of the key and discard it
-        - True to raise the error"""
+        - True to raise the error
+        When validating asynchronously, it can return an awaitable"""
         return None
 
     def json_schema(self, **kwargs):
@@ -1249,10 +3049,20 @@ class Optional(Hook):
     """
     Creates a an optional key for a dict
     """
-    def __init__(self, schema, **kwargs):
+    def __init__(self, schema, copy_default=False, **kwargs):
+        """
+        Takes
+        - default: the value used when no key of the data matches, or a
+            callable returning it
+        - copy_default: False to use the default value as is, True to deep
+            copy it for each dict
+        """
         kwargs.setdefault('priority', _priority(schema) - 1)
         default = kwargs.pop("default", self._MARKER)
         super(Optional, self).__init__(schema, **kwargs)
+        if copy_default not in (False, True):
+            raise ValueError('copy_default must be False or True, got %r' %
+                (copy_default,))
         if default is not self._MARKER:
             if _priority(self._schema) != COMPARABLE:
                 raise TypeError(
@@ -1261,6 +3071,7 @@ class Optional(Hook):
                     '"%r" is too complex.' % (self._schema,)
                 )
             self.default = default
+            self.copy_default = copy_default
 
     def handle (self, *args):
         return True
@@ -1268,6 +3079,11 @@ class Optional(Hook):
     def catch (self, *args):
         return True
 
+    @property
+    def pure(self):
+        return Schema.pure.fget(self) and \
+            not callable(getattr(self, 'default', None))
+
     def json_schema(self, **kwargs):
         """
         This schema is generated
@@ -1284,9 +3100,12 @@ class Forbidden(Hook):
         """
         Raises when matched
         """
-        message = "Forbidden key encountered: %r in %r" % (key, data)
+        message = "Forbidden key encountered: %r in %s" % (key,
+            _repr(data))
         self._raise_error(message, data, SchemaForbiddenKeyError)
 
+    pure = Schema.pure
+
     def json_schema(self, **kwargs):
         """
         This schema is generated, but its value will be used as a {'not': ...}
@@ -1302,6 +3121,8 @@ class Clean(Hook):
     def handle (self, *args):
         return False
 
+    pure = Schema.pure
+
     def json_schema(self, **kwargs):
         """
         This schema is generated
@@ -1318,6 +3139,15 @@ class Const(Schema):
         super(Const, self).validate(data)
         return data
 
+    async def validate_async(self, data, limit=None):
+        await super(Const, self).validate_async(data, limit)
+        return data
+
+    @_steps_for(validate)
+    def _steps(self, data):
+        yield from super(Const, self)._steps(data)
+        return data
+
 
 @schema_class('not')
 class Not(Schema):
@@ -1328,9 +3158,31 @@ class Not(Schema):
         try: super(Not, self).validate(data)
         except SchemaError: return data
         else:
-            message = '%r matches forbidden value %r' % (data, self._schema)
+            message = '%s matches forbidden value %r' % (_repr(data),
+                self._schema)
             return self._raise_error(message, data, SchemaForbiddenValueError)
 
+    async def validate_async(self, data, limit=None):
+        try: await super(Not, self).validate_async(data, limit)
+        except SchemaError: return data
+        else:
+            message = '%s matches forbidden value %r' % (_repr(data),
+                self._schema)
+            return self._raise_error(message, data, SchemaForbiddenValueError)
+
+    @_steps_for(validate)
+    def _steps(self, data):
+        try: yield from super(Not, self)._steps(data)
+        except SchemaError: return data
+        else:
+            message = '%s matches forbidden value %r' % (_repr(data),
+                self._schema)
+            return self._raise_error(message, data, SchemaForbiddenValueError)
+
+    def keys(self, item, comparable_keys, type_keys, global_keys):
+        # matches what the schema does not match
+        global_keys.append(item)
+
     def json_schema(self, schema_id=None, **kwargs):
         """
         Generates a JSON schema. consecutive 'not' are merged.
@@ -1347,6 +3199,602 @@ class Not(Schema):
         return self._json_schema_aux(schema_id, schema_dict)
 
 
+DEFINITIONS = {} # the schemas referenced by Ref by default
+
+@schema_class('lazy')
+class Lazy(BaseSchema):
+    """
+    A schema built on first use, enables recursive schemas
+    """
+    def __init__(self, factory, ref=None, **kwargs):
+        """
+        Takes
+        - factory: a function returning the schema
+        - ref: the name of the schema in the JSON schema definitions
+            (default: the name of factory)
+        """
+        super(Lazy, self).__init__(**kwargs)
+        if not callable(factory):
+            raise TypeError("Expected a callable, not %r" % factory)
+        self._factory = factory
+        self._ref = ref
+        self._resolved = None
+        self._in_walk = False
+
+    def __repr__(self):
+        if self._factory is None:
+            return "%s(ref=%r)" % (self.__class__.__name__, self._ref)
+        return "%s(%r)" % (self.__class__.__name__, self._factory)
+
+    def __getstate__(self):
+        # the factory (often a lambda) is replaced by the schema it builds
+        state = super(Lazy, self).__getstate__()
+        state['_resolved'] = self.resolve()
+        state['_factory'] = None
+        state['_ref'] = self._ref or _callable_str(self._factory)
+        state['_in_walk'] = False
+        return state
+
+    def resolve(self):
+        """
+        Returns the schema, built on first call
+        """
+        if self._resolved is None:
+            schema = self._factory()
+            if not isinstance(schema, BaseSchema):
+                schema = self._generate_cls('schema', schema)
+            self._resolved = schema
+        return self._resolved
+
+    @property
+    def pure(self):
+        # a recursive schema is pure if the rest is
+        if self._in_walk: return True
+        self._in_walk = True
+        try: return self.resolve().pure
+        finally: self._in_walk = False
+
+    @property
+    def _awaits(self):
+        # a recursive schema awaits if the rest does
+        if self._in_walk: return False
+        self._in_walk = True
+        try: return self.resolve()._awaits
+        finally: self._in_walk = False
+
+    def validate(self, data):
+        return self.resolve().validate(data)
+
+    async def validate_async(self, data, limit=None):
+        return await self.resolve().validate_async(data, limit)
+
+    def _validate_incremental(self, data, changes, previous):
+        return self.resolve()._validate_incremental(data, changes, previous)
+
+    def _project(self, selection):
+        return self.resolve()._project(selection)
+
+    def view(self, data):
+        return self.resolve().view(data)
+
+    @_steps_for(validate)
+    def _steps(self, data):
+        return (yield self.resolve(), data)
+
+    def _definition_key(self):
+        """
+        Returns the key of the JSON schema definition of the schema
+        """
+        return self.resolve()
+
+    def json_schema(self, schema_id=None, **kwargs):
+        """
+        Generates a {'$ref': '#/definitions/...'} schema, the definition is
+        added to the root JSON schema
+        """
+        if hasattr(self, '_json_schema'):
+            return self._json_schema_aux(schema_id, self._json_schema)
+        local = _json_schema_local()
+        definitions = local.definitions
+        names = local.names
+        # lazy schemas of a same schema share the same definition
+        schema = self.resolve()
+        key = self._definition_key()
+        name = names.get(key)
+        if name is None:
+            name = self._ref or _callable_str(self._factory)
+            if not name.isidentifier(): name = 'lazy'
+            # do not mix up different schemas with the same name
+            used = set(names.values())
+            ref, i = name, 1
+            while ref in used:
+                i += 1
+                ref = '%s%d' % (name, i)
+            names[key] = name = ref
+            # prevents infinite recursion
+            definitions[name] = True
+            schema_dict = schema.json_schema(**kwargs)
+            if schema_dict is None:
+                del definitions[name]
+                return self._json_schema_aux(schema_id, None)
+            definitions[name] = schema_dict
+        elif name not in definitions:
+            return self._json_schema_aux(schema_id, None)
+        return self._json_schema_aux(schema_id,
+            {'$ref': '#/definitions/%s' % name})
+
+
+@schema_class('ref')
+class Ref(Lazy):
+    """
+    A reference to a named schema, resolved on first use
+    """
+    def __init__(self, name, definitions=None, **kwargs):
+        """
+        Takes
+        - name: the name of the schema
+        - definitions: a mapping of the schemas by name, may be completed
+            after the creation of the reference (default: schema.DEFINITIONS)
+        """
+        self._definitions = DEFINITIONS if definitions is None else definitions
+        self._built = None # the _BuiltRef of the plain definition
+        super(Ref, self).__init__(self._lookup, ref=name, **kwargs)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self._ref)
+
+    def __getstate__(self):
+        state = super(Ref, self).__getstate__()
+        state['_definitions'] = None
+        state['_built'] = None
+        return state
+
+    def _lookup(self):
+        try:
+            schema = self._definitions[self._ref]
+        except KeyError:
+            raise KeyError("undefined schema reference %r" % self._ref)
+        if isinstance(schema, BaseSchema): return schema
+        # the references to a plain definition with the same options and
+        # error share the schema built, the definitions are left untouched
+        built = _built_refs()
+        key = (id(self._definitions), self._ref, frozenset((option, id(value))
+            for option, value in self.options.items()))
+        entry = built.get(key)
+        if entry is None or entry.definition is not schema \
+                or entry.error != self._error:
+            entry = _BuiltRef(self._definitions, schema, self.options,
+                self._error, self._generate_cls('schema', schema))
+            built[key] = entry
+        self._built = entry
+        return entry.schema
+
+    def _definition_key(self):
+        # the references to a same name share the same definition
+        return id(self._definitions), self._ref
+
+
+class _BuiltRef(object):
+    """
+    The schema built by Ref from a plain definition, with what it was built
+    from (which keeps their ids in the key of _built_refs)
+    """
+    __slots__ = ('definitions', 'definition', 'options', 'error', 'schema',
+        '__weakref__')
+
+    def __init__(self, definitions, definition, options, error, schema):
+        self.definitions = definitions
+        self.definition = definition
+        self.options = options
+        self.error = error
+        self.schema = schema
+
+# the _BuiltRef by definitions id, name and options ids, kept as long as a Ref
+# uses them, in a weakref.WeakValueDictionary made on first use
+_built_refs_tables = {}
+def _built_refs():
+    """
+    Returns the weakref.WeakValueDictionary of the _BuiltRef
+    """
+    try: return _built_refs_tables['table']
+    except KeyError: pass
+    import weakref
+    return _built_refs_tables.setdefault('table', weakref.WeakValueDictionary())
+
+
+@schema_class('cached')
+class Cached(Schema):
+    """
+    Memoizes the validation of hashable data in a LRU cache.
+    Only pure schemas can be cached, mark the callables as pure with
+    Use(..., pure=True) if needed.
+    """
+    def __init__(self, schema, maxsize=128, **kwargs):
+        """
+        maxsize is the maximum number of cached results (None for no limit)
+        """
+        super(Cached, self).__init__(schema, **kwargs)
+        if not self.pure:
+            raise TypeError("%r is not pure and cannot be cached" % schema)
+        self._maxsize = maxsize
+        self._cache = {} # ordered from the least to the most recently used
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # the cache is not pickled
+        state = super(Cached, self).__getstate__()
+        state.update(_cache={}, hits=0, misses=0)
+        return state
+
+    def validate(self, data):
+        """
+        Returns the cached result of data, or validates it
+        Errors are cached too and raised again as new exceptions
+        """
+        cache = self._cache
+        try:
+            key = _cache_key(data)
+            result = cache[key]
+        # not hashable
+        except TypeError:
+            return super(Cached, self).validate(data)
+        except KeyError:
+            self.misses += 1
+            try:
+                value = super(Cached, self).validate(data)
+            except SchemaError as x:
+                cache[key] = (False, (type(x), list(x.autos), list(x.errors)))
+                raise x
+            else: cache[key] = (True, value)
+            finally:
+                if self._maxsize is not None and len(cache) > self._maxsize:
+                    try: del cache[next(iter(cache))]
+                    except (KeyError, RuntimeError, StopIteration): pass
+            return value
+        self.hits += 1
+        # move the key to the end
+        try: cache[key] = cache.pop(key)
+        except KeyError: pass
+        valid, value = result
+        if valid: return value
+        cls, autos, errors = value
+        raise cls(list(autos), list(errors))
+
+    def cache_info(self):
+        """
+        Returns a (hits, misses, maxsize, currsize) named tuple
+        """
+        return _CacheInfo(self.hits, self.misses, self._maxsize, len(self._cache))
+
+    def cache_clear(self):
+        """
+        Clears the cache and its statistics
+        """
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class _CacheInfo(tuple):
+    """
+    The (hits, misses, maxsize, currsize) statistics of Cached.cache_info, like
+    the CacheInfo named tuple of functools.lru_cache
+    """
+    __slots__ = ()
+    _fields = ('hits', 'misses', 'maxsize', 'currsize')
+
+    def __new__(cls, hits, misses, maxsize, currsize):
+        return tuple.__new__(cls, (hits, misses, maxsize, currsize))
+
+    hits = property(lambda self: self[0])
+    misses = property(lambda self: self[1])
+    maxsize = property(lambda self: self[2])
+    currsize = property(lambda self: self[3])
+
+    def __repr__(self):
+        return 'CacheInfo(%s)' % ', '.join('%s=%r' % field
+            for field in zip(self._fields, self))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+
+_view_classes = {}
+def _define_views():
+    """
+    Defines the classes of the views returned by Dict.view and List.view
+    """
+    from collections.abc import Mapping, Sequence
+
+    class DictView(Mapping):
+        """
+        A read-only dict validating its values on first access
+        """
+        __slots__ = ('_schema', '_values', '_pending', '_keys')
+
+        def __init__(self, schema, values, pending):
+            self._schema = schema
+            self._values = values # the validated values
+            self._pending = pending # the values to validate
+            self._keys = list(pending) + list(values)
+
+        def __getitem__(self, key):
+            try: return self._values[key]
+            except KeyError: pass
+            svalue, value = self._pending[key]
+            try: value = svalue.view(value)
+            except SchemaError as x:
+                schema = self._schema
+                message = schema._prepend_schema_name("Key '%s' error:" % key)
+                x.prepend(message, schema._error)
+                raise x
+            self._values[key] = value
+            self._pending.pop(key, None)
+            return value
+
+        def __iter__(self):
+            return iter(self._keys)
+
+        def __len__(self):
+            return len(self._keys)
+
+        def __repr__(self):
+            return '%s(%r)' % (self.__class__.__name__, dict(self.items()))
+
+        def __reduce__(self):
+            return dict, (dict(self.items()),)
+
+        def materialize(self):
+            """
+            Returns the validated dict, with plain dicts and lists
+            """
+            return {key: _materialize(value) for key, value in self.items()}
+
+    class ListView(Sequence):
+        """
+        A read-only list validating its items on first access
+        """
+        __slots__ = ('_schema', '_data', '_items')
+        _MARKER = object()
+
+        def __init__(self, schema, data):
+            self._schema = schema
+            self._data = data
+            self._items = [self._MARKER] * len(data) # the validated items
+
+        def __getitem__(self, index):
+            if isinstance(index, slice):
+                return [self[i] for i in range(*index.indices(len(self)))]
+            item = self._items[index]
+            if item is self._MARKER:
+                item = self._items[index] = \
+                    self._schema.view(self._data[index])
+            return item
+
+        def __len__(self):
+            return len(self._items)
+
+        def __eq__(self, other):
+            if not isinstance(other, (ListView, type(self._data))):
+                return NotImplemented
+            return len(self) == len(other) and \
+                all(a == b for a, b in zip(self, other))
+
+        def __repr__(self):
+            return '%s(%r)' % (self.__class__.__name__, list(self))
+
+        def __reduce__(self):
+            return list, (list(self),)
+
+        def materialize(self):
+            """
+            Returns the validated list (or tuple), with plain dicts and lists
+            """
+            return type(self._data)(_materialize(item) for item in self)
+
+    _view_classes[dict] = DictView
+    _view_classes[list] = ListView
+
+
+def _materialize(value):
+    """
+    Returns value, or the validated data of a view
+    """
+    if type(value) in _view_classes.values(): return value.materialize()
+    return value
+
+
+def _same(data, validated):
+    """
+    Returns whether validated is data, or an equal copy with the same types
+    """
+    if data is validated: return True
+    if type(data) is not type(validated): return False
+    if type(data) in (list, tuple):
+        return len(data) == len(validated) and all(map(_same, data, validated))
+    if type(data) is dict:
+        return len(data) == len(validated) and all(key in validated and
+            _same(value, validated[key]) for key, value in data.items())
+    return data == validated
+
+
+def _cache_key(data):
+    """
+    Returns a hashable key for data, so that equal data of different types
+    (like 1, 1.0 and True) are not mixed up
+    """
+    if type(data) in (tuple, frozenset):
+        return type(data), type(data)(_cache_key(item) for item in data)
+    return type(data), data
+
+
+# the reprlib.Repr shortening the data in the error messages, made on first
+# use
+_short_repr = {}
+def _repr(data):
+    """
+    Returns the repr of data for an error message, shortened for long
+    strings and large or deep containers
+    """
+    if type(data) in (str, bytes) and len(data) <= 100 or \
+            type(data) in (type(None), bool, float):
+        return repr(data)
+    if not _short_repr: _define_short_repr()
+    return _short_repr['repr'](data)
+
+
+def _define_short_repr():
+    """
+    Defines the reprlib.Repr of the error messages
+    """
+    import itertools, reprlib
+
+    class ShortRepr(reprlib.Repr):
+        def __init__(self):
+            super(ShortRepr, self).__init__()
+            self.maxstring = self.maxlong = 100
+            self.maxother = 200
+            self.maxtuple = self.maxlist = self.maxset = 20
+            self.maxfrozenset = self.maxdict = 20
+
+        def repr_dict(self, x, level):
+            # keeps the order of the keys
+            if not x: return '{}'
+            if level <= 0: return '{...}'
+            pieces = ['%s: %s' % (self.repr1(key, level - 1),
+                self.repr1(value, level - 1))
+                for key, value in itertools.islice(x.items(), self.maxdict)]
+            if len(x) > self.maxdict: pieces.append('...')
+            return '{%s}' % ', '.join(pieces)
+
+    _short_repr['repr'] = ShortRepr().repr
+
+
+def _isawaitable(obj):
+    """
+    Returns whether obj can be awaited
+    """
+    return hasattr(type(obj), '__await__')
+
+
+async def _await(obj):
+    """
+    Awaits obj if needed
+    """
+    if _isawaitable(obj): return await obj
+    return obj
+
+
+def _semaphore(limit):
+    """
+    Converts a concurrency limit to an asyncio.Semaphore
+    """
+    if isinstance(limit, int):
+        # no coroutine could ever run
+        if limit < 1:
+            raise ValueError('limit must be at least 1, got %r' % limit)
+        import asyncio
+        return asyncio.Semaphore(limit)
+    return limit
+
+
+async def _gather(coroutines):
+    """
+    Runs coroutines concurrently, waits for all of them, and raises the error
+    of the first failed one (in order), or returns their results
+    The coroutines are first run until they await, only the ones awaiting
+    are gathered (most validations never await)
+    """
+    outcomes = [] # the (valid, result or error) of the coroutines
+    started = [] # the index and the _Started of the awaiting coroutines
+    try:
+        for coroutine in coroutines:
+            try: yielded = coroutine.send(None)
+            except StopIteration as x: outcomes.append((True, x.value))
+            except Exception as x: outcomes.append((False, x))
+            else:
+                started.append((len(outcomes), _Started(coroutine, yielded)))
+                outcomes.append(None)
+    except BaseException:
+        for _, awaitable in started: awaitable.close()
+        raise
+    if started:
+        import asyncio
+        async def outcome(awaitable):
+            try: return True, await awaitable
+            except Exception as x: return False, x
+        results = await asyncio.gather(*(outcome(awaitable)
+            for _, awaitable in started))
+        for (i, _), result in zip(started, results): outcomes[i] = result
+    for valid, value in outcomes:
+        if not valid: raise value
+    return [value for valid, value in outcomes]
+
+
+class _Started(object):
+    """
+    Awaits a coroutine already run until its first await, see _gather
+    """
+    __slots__ = ('_coroutine', '_yielded')
+
+    def __init__(self, coroutine, yielded):
+        self._coroutine = coroutine
+        self._yielded = yielded # what the coroutine awaits
+
+    def __await__(self):
+        coroutine, yielded = self._coroutine, self._yielded
+        while True:
+            try: sent = yield yielded
+            except BaseException as x:
+                try: yielded = coroutine.throw(x)
+                except StopIteration as stop: return stop.value
+            else:
+                try: yielded = coroutine.send(sent)
+                except StopIteration as stop: return stop.value
+
+    def close(self):
+        self._coroutine.close()
+
+
+def _fingerprint(cls, args, kwargs):
+    """
+    Returns a fingerprint of the arguments building a schema
+    """
+    import re, hashlib, types
+    source = repr((__version__, cls.__module__, cls.__qualname__,
+        args, sorted(kwargs.items())))
+    # memory addresses change from one process to another
+    address = re.compile(r' at 0x[0-9a-fA-F]+')
+    fingerprint = hashlib.sha256(address.sub('', source).encode('utf-8'))
+    # the body of the functions is not in their repr, their code is added
+    codes, seen, stack = [], set(), [args, kwargs]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen: continue
+        seen.add(id(node))
+        if isinstance(node, types.FunctionType): stack.append(node.__code__)
+        elif isinstance(node, types.MethodType): stack.append(node.__func__)
+        elif isinstance(node, types.CodeType):
+            # the nested functions are constants of the code
+            consts = [const for const in node.co_consts
+                if not isinstance(const, types.CodeType)]
+            stack.extend(const for const in node.co_consts
+                if isinstance(const, types.CodeType))
+            # the order of the sets changes from one process to another
+            consts = [sorted(map(repr, const)) if isinstance(const, frozenset)
+                else const for const in consts]
+            codes.append(node.co_code + repr(consts).encode('utf-8'))
+        elif isinstance(node, BaseSchema): stack.extend(vars(node).values())
+        elif isinstance(node, dict):
+            stack.extend(node)
+            stack.extend(node.values())
+        elif isinstance(node, (list, tuple, set, frozenset)):
+            stack.extend(node)
+    for code in sorted(codes): fingerprint.update(code)
+    return fingerprint.hexdigest()
+
+
 def _callable_str(callable_):
     if hasattr(callable_, "__name__"):
         return callable_.__name__
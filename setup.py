@@ -25,7 +25,7 @@ setup(
     py_modules=["schema"],
     long_description=codecs.open("README.rst", "r", "utf-8").read(),
     long_description_content_type='text/x-rst',
-    install_requires=open("requirements.txt", "r").read().split("\n"),
+    install_requires=[line for line in open("requirements.txt", "r").read().split("\n") if line],
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Topic :: Utilities",
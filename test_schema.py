@@ -10,29 +10,38 @@ from functools import partial
 from operator import methodcaller
 
 from mock import Mock
-from pytest import mark, raises
+from pytest import mark, raises, warns
 from schema import (
     And,
     Any,
+    BaseSchema,
+    Cached,
     Clean,
     Const,
     Dict,
     Forbidden,
     Hook,
+    In,
+    Lazy,
     List,
     Not,
+    Object,
     Optional,
     Or,
+    Ref,
     Regex,
     Schema,
+    SchemaDepthError,
     SchemaError,
     SchemaForbiddenKeyError,
     SchemaForbiddenValueError,
     SchemaMissingKeyError,
+    SchemaOnlyOneAllowedError,
     SchemaUnexpectedTypeError,
     SchemaWrongKeyError,
     SchemaWrongLengthError,
     Use,
+    ValidationStats,
 )
 
 if sys.version_info[0] == 3:
@@ -134,6 +143,13 @@ def test_or_only_one():
         print('testing')
         extra_keys_schema.validate({"test1": "value", "test2": "other_value"})
 
+    # the same Or can be used in several dicts, nested or not
+    schema = Schema({or_rule: str, Optional("sub"): {And(or_rule): str}})
+    assert schema.validate({"test1": "a", "sub": {"test2": "b"}})
+    with raises(SchemaOnlyOneAllowedError):
+        schema.validate({"test1": "a", "sub": {"test1": "b", "test2": "b"}})
+    assert schema.validate({"test2": "a"})
+
 
 def test_test():
     def unique_list(_list):
@@ -195,6 +211,75 @@ def test_regex():
         Regex(None).validate("bar")
 
 
+def test_regex_match():
+    assert Regex(r"foo").validate("afoot") == "afoot"
+    assert Regex(r"foo", match="match").validate("foot") == "foot"
+    with SE:
+        Regex(r"foo", match="match").validate("afoot")
+    assert Regex(r"fo+", match="fullmatch").validate("fooo") == "fooo"
+    with SE:
+        Regex(r"fo+", match="fullmatch").validate("foot")
+    with raises(ValueError):
+        Regex(r"foo", match="other")
+    assert repr(Regex(r"a", match="match")) == "Regex(re.compile('a'), match='match')"
+    # anchored modes fail early on long strings
+    assert not Regex(r"a", match="match").is_valid("b" * 2 ** 20)
+    # the long data are shortened in the errors
+    with raises(SchemaError) as e:
+        Regex(r"a", match="match").validate("b" * 2 ** 20)
+    assert len(e.value.code) < 200 and "..." in e.value.code
+    # bytes
+    assert Regex(br"^foo").validate(b"foot") == b"foot"
+    with SE:
+        Regex(br"^foo").validate("foot")
+    with SE:
+        Regex(r"^foo").validate(b"foot")
+    with SE:
+        Regex(r"^foo").validate((1, 2))
+    assert Schema({Regex(br"^a"): int, str: str}).validate({b"ab": 1, "ab": "c"}) == {b"ab": 1, "ab": "c"}
+    # json schema
+    assert Regex(r"a|b", match="match").json_schema() == {"type": "string", "regex": "^(?:a|b)"}
+    assert Regex(r"a|b", match="fullmatch").json_schema() == {"type": "string", "regex": "^(?:a|b)$"}
+
+
+def test_regex_validate_many():
+    s = Regex(r"^[a-z]+$")
+    assert s.validate_many(["a", "b"]) == ["a", "b"]
+    assert s.validate_many(iter(["a", "b"])) == ["a", "b"]
+    with SE:
+        s.validate_many(["a", "B"])
+    with SE:
+        s.validate_many(["a", None])
+
+
+def test_regex_lib():
+    # like re2: only search, and \z but not \Z
+    class Pattern(object):
+        def __init__(self, pattern, flags=0):
+            if r"\Z" in pattern:
+                raise ValueError("invalid escape sequence: \\Z")
+            self.pattern = pattern
+            self._re = re.compile(pattern.replace(r"\z", r"\Z"), flags)
+        def search(self, data):
+            return self._re.search(data)
+    class RegexLib(object):
+        error = ValueError
+        @staticmethod
+        def compile(pattern, flags=0):
+            return Pattern(pattern, flags=flags)
+    s = Regex(r"fo|foo", match="fullmatch", regex_lib=RegexLib)
+    assert s.validate("foo") == "foo"
+    with SE:
+        s.validate("fooo")
+    with SE:
+        s.validate("foo\n")
+    s = Regex(r"fo|bar", match="match", flags=re.I, regex_lib=RegexLib)
+    assert s.validate("BARfo") == "BARfo"
+    with SE:
+        s.validate("abar")
+    assert Regex(r"foo", regex_lib=RegexLib).validate("afoo") == "afoo"
+
+
 def test_validate_list():
     assert Schema([1, 0]).validate([1, 0, 1, 1]) == [1, 0, 1, 1]
     assert Schema([1, 0]).validate([]) == []
@@ -1334,3 +1419,907 @@ def test_hook_edit():
         'other': 'other',
     })
     assert s.validate({'test': 'test', 'other': 'other'}) == {'other': 'other', 'seen': True}
+
+
+def test_cached():
+    calls = []
+    def double(x):
+        calls.append(x)
+        return x * 2
+    s = Cached(Or(Regex(r'^[a-z]+$'), And(int, Use(double, pure=True))), maxsize=2)
+    assert s.validate(2) == 4
+    assert s.validate(2) == 4
+    assert calls == [2]
+    assert s.cache_info() == (1, 1, 2, 1)
+    # equal data of different types are not mixed up
+    assert s.validate(1) == 2
+    with raises(SchemaError) as e1:
+        s.validate(True)
+    assert s.cache_info().currsize == 2
+    # errors are cached, and raised as new exceptions
+    with raises(SchemaError) as e2:
+        s.validate(True)
+    assert e1.value is not e2.value
+    assert e1.value.autos == e2.value.autos
+    assert s.cache_info() == (2, 3, 2, 2)
+    # unhashable data are not cached
+    with SE:
+        s.validate([1])
+    assert s.cache_info() == (2, 3, 2, 2)
+    s.cache_clear()
+    assert s.cache_info() == (0, 0, 2, 0)
+    # works as a key
+    s = Schema({Cached(Regex(r'^a')): int, Optional(Cached(str)): str})
+    assert s.validate({'ab': 1, 'b': 'c'}) == {'ab': 1, 'b': 'c'}
+
+
+def test_cached_pure():
+    assert Schema(int).pure
+    assert Schema({'a': [int], Optional('b', default=1): Regex('^a')}).pure
+    assert not Schema({Optional('b', default=list): int}).pure
+    assert not Use(int).pure
+    assert Use(int, pure=True).pure
+    assert not Schema(lambda x: x).pure
+    assert Or('a', 'b', only_one=True).pure
+    with raises(TypeError):
+        Cached(Use(int))
+    with raises(TypeError):
+        Cached({Hook('a'): int})
+
+
+def test_validate_async():
+    import asyncio
+    running, seen = [0], []
+
+    async def resolve(x):
+        running[0] += 1
+        seen.append(running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return x * 2
+
+    s = Schema({'a': Use(resolve), 'b': [And(int, Use(resolve))],
+                Optional('c'): Or(None, Use(resolve)), str: int})
+    data = {'a': 1, 'b': [2, 3, 4], 'c': 5, 'd': 6}
+    result = asyncio.run(s.validate_async(data))
+    assert result == {'a': 2, 'b': [4, 6, 8], 'c': 10, 'd': 6}
+    assert max(seen) == 5
+    # concurrency limit
+    del seen[:]
+    assert asyncio.run(s.validate_async(data, limit=2)) == result
+    assert max(seen) == 2
+    # synchronous validation is unchanged
+    assert Schema({'a': Use(int)}).validate({'a': '1'}) == {'a': 1}
+    # errors are the same as the synchronous ones
+    async def fail(x):
+        raise ValueError(x)
+    s2 = Schema({'a': int, 'b': [int]})
+    with raises(SchemaError) as e:
+        asyncio.run(s2.validate_async({'a': 1, 'b': [2, 'x']}))
+    with raises(SchemaError) as e_sync:
+        s2.validate({'a': 1, 'b': [2, 'x']})
+    assert e.value.autos == e_sync.value.autos
+    with raises(SchemaMissingKeyError):
+        asyncio.run(s.validate_async({'b': []}))
+    with raises(SchemaError) as e:
+        asyncio.run(Schema(Use(fail)).validate_async(1))
+    assert e.value.code == "fail(1) raised ValueError(1)"
+    assert asyncio.run(Schema(Const(Use(resolve))).validate_async(1)) == 1
+    assert asyncio.run(Not(Use(fail)).validate_async(1)) == 1
+    # the values that cannot await are validated synchronously
+    sync = Schema({'a': [Use(int)], 'b': Or(None, {'c': str})})
+    assert not sync._may_await and s._may_await
+    assert asyncio.run(sync.validate_async({'a': ['1'], 'b': {'c': 'd'}})) == {'a': [1], 'b': {'c': 'd'}}
+    node = Schema({'v': int, Optional('children'): [Lazy(lambda: node)]})
+    assert not node._may_await
+    lazy = Schema({Optional('children'): [Lazy(lambda: lazy)], 'v': Use(resolve)})
+    assert lazy._may_await
+    assert asyncio.run(lazy.validate_async({'v': 1, 'children': [{'v': 2}]})) == {'v': 2, 'children': [{'v': 4}]}
+    with raises(ValueError):
+        asyncio.run(s.validate_async(data, limit=0))
+
+
+def test_validate_async_hook():
+    import asyncio
+
+    class Rename(Hook):
+        async def handle(self, key, value, new, data):
+            await asyncio.sleep(0)
+            new[key.upper()] = value
+            return False
+
+    s = Schema({Rename('a'): int, 'b': int})
+    assert asyncio.run(s.validate_async({'a': 1, 'b': 2})) == {'A': 1, 'b': 2}
+
+
+def test_validate_iterative():
+    s = Schema({'a': [And(int, Use(str))], Optional('b'): Or(None, {'c': Const(Use(int))}),
+                Clean('d'): object, 'e': Not(Or(1, 2))})
+    data = {'a': [1, 2], 'b': {'c': '3'}, 'd': 4, 'e': 3}
+    assert s.validate_iterative(data) == s.validate(data)
+    for bad in ({'a': [1, 'x'], 'e': 3}, {'a': [], 'e': 1}, {'a': [], 'b': {'c': 'x'}, 'e': 3},
+                {'a': []}, {'a': [], 'e': 3, 'f': 4}):
+        with raises(SchemaError) as e:
+            s.validate(bad)
+        with raises(type(e.value)) as e_iter:
+            s.validate_iterative(bad)
+        assert e.value.autos == e_iter.value.autos
+    # hooks and user validators
+    class Count(Schema):
+        count = 0
+        def validate(self, data):
+            Count.count += 1
+            return super(Count, self).validate(data)
+    s = Schema({Forbidden('f'): int, str: Count([int])})
+    assert s.validate({'a': [1]}) == {'a': [1]}
+    count, Count.count = Count.count, 0
+    assert s.validate_iterative({'a': [1]}) == {'a': [1]}
+    assert Count.count == count
+    with raises(SchemaForbiddenKeyError):
+        s.validate_iterative({'f': 1})
+
+
+def test_validate_iterative_deep():
+    depth = 5000
+    schema = Schema(int)
+    for _ in range(depth):
+        schema = Dict({'c': List(schema)})
+    data = 1
+    for _ in range(depth):
+        data = {'c': [data]}
+    with raises(RecursionError):
+        schema.validate(data)
+    result, doc = schema.validate_iterative(data), data
+    for _ in range(depth):
+        assert result is not doc
+        result, doc = result['c'][0], doc['c'][0]
+    assert result == 1
+    with raises(SchemaDepthError):
+        schema.validate_iterative(data, max_depth=100)
+    with raises(SchemaDepthError):
+        Schema([[[int]]]).validate_iterative([[[1]]], max_depth=2)
+    assert Schema([[[int]]]).validate_iterative([[[1]]], max_depth=3) == [[[1]]]
+    # the failed branches of Or do not show the whole data in their errors
+    tree = Schema({'n': Or(None, Lazy(lambda: tree))})
+    data = None
+    for _ in range(depth):
+        data = {'n': data}
+    result = tree.validate_iterative(data)
+    for _ in range(depth):
+        result = result['n']
+    assert result is None
+    with raises(SchemaError) as e:
+        tree.validate_iterative({'n': data, 'm': 1})
+    assert len(e.value.autos[-1]) < 1000
+    with raises(SchemaError) as e:
+        Schema(None).validate(data)
+    assert '...' in e.value.code
+
+
+def test_lazy():
+    node = Schema({'value': int, Optional('children'): [Lazy(lambda: node)]})
+    data = {'value': 1, 'children': [{'value': 2}, {'value': 3, 'children': []}]}
+    assert node.validate(data) == data
+    with raises(SchemaError):
+        node.validate({'value': 1, 'children': [{'value': 'x'}]})
+    assert node.validate_iterative(data) == data
+    import asyncio
+    assert asyncio.run(node.validate_async(data)) == data
+    assert node.pure
+    # resolved once
+    calls = []
+    def factory():
+        calls.append(1)
+        return int
+    s = Schema([Lazy(factory)])
+    assert s.validate([1, 2]) == [1, 2]
+    assert s.validate([3]) == [3]
+    assert calls == [1]
+    with raises(TypeError):
+        Lazy(1)
+
+
+def test_ref():
+    definitions = {}
+    tree = Or(int, Ref('Tree', definitions), Ref('Leaf', definitions))
+    definitions['Tree'] = {'left': tree, 'right': tree}
+    definitions['Leaf'] = {'leaf': str}
+    data = {'left': 1, 'right': {'left': {'leaf': 'a'}, 'right': 2}}
+    assert tree.validate(data) == data
+    with raises(SchemaError):
+        tree.validate({'left': 1, 'right': 'x'})
+    assert repr(Ref('Tree')) == "Ref('Tree')"
+    with raises(SchemaError):
+        Schema(Ref('Undefined', {})).validate(1)
+
+
+def test_json_schema_lazy():
+    definitions = {}
+    node = Schema({'value': int, Optional('children'): [Ref('Node', definitions)]})
+    definitions['Node'] = node
+    assert Schema({'root': Ref('Node', definitions)}).json_schema('my-id') == {
+        'type': 'object',
+        'properties': {'root': {'$ref': '#/definitions/Node'}},
+        'required': ['root'],
+        'additionalProperties': False,
+        'definitions': {
+            'Node': {
+                'type': 'object',
+                'properties': {
+                    'value': {'type': 'integer'},
+                    'children': {'type': 'array', 'items': {'$ref': '#/definitions/Node'}},
+                },
+                'required': ['value'],
+                'additionalProperties': False,
+            },
+        },
+        'id': 'my-id',
+        '$schema': 'http://json-schema.org/draft-07/schema#',
+    }
+    # names are made unique
+    s = Schema([Lazy(lambda: int), Lazy(lambda: str, ref='Str'), Lazy(lambda: bool, ref='Str')])
+    assert s.json_schema() == {
+        'type': 'array',
+        'items': {'anyOf': [
+            {'$ref': '#/definitions/lazy'},
+            {'$ref': '#/definitions/Str'},
+            {'$ref': '#/definitions/Str2'},
+        ]},
+        'definitions': {
+            'lazy': {'type': 'integer'},
+            'Str': {'type': 'string'},
+            'Str2': {'type': 'boolean'},
+        },
+    }
+    # the references to a plain definition share one schema and one definition
+    from types import MappingProxyType
+    definitions = {}
+    tree = Or(int, Ref('Tree', definitions))
+    definitions['Tree'] = {'left': tree, 'right': Or(int, Ref('Tree', definitions))}
+    assert tree.validate({'left': 1, 'right': {'left': 2, 'right': 3}})
+    assert type(definitions['Tree']) is dict
+    assert tree._args[1].resolve() is definitions['Tree']['right']._args[1].resolve()
+    assert list(Schema(tree).json_schema()['definitions']) == ['Tree']
+    # the options and the error of the first reference are not shared
+    definitions = {'Name': str}
+    assert Ref('Name', definitions, error='first').validate('a') == 'a'
+    with raises(SchemaError) as e:
+        Ref('Name', definitions, error='second').validate(1)
+    assert e.value.code == 'second'
+    assert definitions == {'Name': str}
+    definitions = {'Leaf': {'leaf': str}}
+    proxy = MappingProxyType(definitions)
+    leaves = Schema([Ref('Leaf', proxy), Ref('Leaf', proxy)])
+    assert leaves.validate([{'leaf': 'a'}]) == [{'leaf': 'a'}]
+    assert list(leaves.json_schema()['definitions']) == ['Leaf']
+
+
+def test_pickle():
+    import pickle
+    node = Schema({'value': int, Optional('children'): [Lazy(lambda: node)]})
+    s = Schema({
+        'a': And(Or('x', 'y'), Use(str.upper)),
+        Optional('b', default=1): int,
+        Regex('^c', flags=re.I): [node],
+        int: Cached(Or(1, 2)),
+    }, ignore_extra_keys=True)
+    data = {'a': 'x', 'C1': [{'value': 1, 'children': [{'value': 2}]}], 3: 1, 'z': 0}
+    expected = {'a': 'X', 'b': 1, 'C1': data['C1'], 3: 1}
+    assert s.validate(data) == expected
+    loaded = pickle.loads(pickle.dumps(s))
+    assert loaded.validate(data) == expected
+    with raises(SchemaError):
+        loaded.validate({'a': 'x', 'C1': [{'value': 'x'}]})
+    # the reset of nested Or still works
+    only_one = pickle.loads(pickle.dumps(Schema({And(Or('x', 'y', only_one=True)): int})))
+    assert only_one.validate({'x': 1}) == {'x': 1}
+    assert only_one.validate({'y': 1}) == {'y': 1}
+    with raises(SchemaOnlyOneAllowedError):
+        only_one.validate({'x': 1, 'y': 1})
+    assert repr(pickle.loads(pickle.dumps(Lazy(lambda: int, ref='Int')))) == "Lazy(ref='Int')"
+    ref = pickle.loads(pickle.dumps(Schema(Ref('Leaf', {'Leaf': str}))))
+    assert ref.validate('a') == 'a'
+    # modules are pickled by name
+    s = pickle.loads(pickle.dumps(Schema({'a': Regex('^a')}, regex_lib=re)))
+    assert s.validate({'a': 'ab'}) == {'a': 'ab'}
+    assert s.options['regex_lib'] is re and s._schema.options['regex_lib'] is re
+
+
+def test_dump_load(tmpdir):
+    path = str(tmpdir.join('schema.pickle'))
+    definition = {'a': int, Optional('b'): [Use(str)]}
+    s = Schema.load(path, definition)
+    assert s.validate({'a': 1, 'b': [1]}) == {'a': 1, 'b': ['1']}
+    # loaded from the file
+    loaded = Schema.load(path, definition)
+    assert loaded is not s and repr(loaded) == repr(s)
+    assert Schema.load(path).validate({'a': 1}) == {'a': 1}
+    # built again if the definition changes
+    other = Schema.load(path, {'a': str})
+    assert other.validate({'a': 'x'}) == {'a': 'x'}
+    assert Schema.load(path, {'a': str}).validate({'a': 'x'}) == {'a': 'x'}
+    # or if the file is corrupted
+    with open(path, 'wb') as f:
+        f.write(b'corrupted')
+    assert Schema.load(path, definition).validate({'a': 1}) == {'a': 1}
+    # modules are pickled by name
+    s = Schema(Regex('^a', regex_lib=re))
+    s.dump(path)
+    assert Schema.load(path).validate('ab') == 'ab'
+    assert os.listdir(str(tmpdir)) == ['schema.pickle']
+    # the schemas that cannot be pickled are built each time
+    with warns(RuntimeWarning):
+        s = Schema.load(path, Use(lambda value: value + 1))
+    assert s.validate(1) == 2
+    assert os.listdir(str(tmpdir)) == ['schema.pickle']
+    # the code of the functions is compared
+    from schema import _fingerprint
+    def f(value): return value + 1
+    before = _fingerprint(Schema, (Use(f),), {})
+    assert _fingerprint(Schema, (Use(f),), {}) == before
+    def f(value): return value + 2
+    assert _fingerprint(Schema, (Use(f),), {}) != before
+    assert _fingerprint(Schema, ({'a': [lambda v: v in {'x', 'y'}]},), {}) != \
+        _fingerprint(Schema, ({'a': [lambda v: v in {'x', 'z'}]},), {})
+
+
+def test_validate_without_state():
+    def state(schema):
+        nodes, stack = {}, [schema]
+        while stack:
+            node = stack.pop()
+            if id(node) in nodes: continue
+            nodes[id(node)] = dict(vars(node))
+            for value in vars(node).values():
+                if isinstance(value, BaseSchema): stack.append(value)
+                elif isinstance(value, (list, tuple)):
+                    stack.extend(v for v in value if isinstance(v, BaseSchema))
+        return nodes
+    schema = Schema({Or('a', 'b', only_one=True): [Or(int, str)], Optional('c', default=1): int,
+                     Lazy(lambda: str): object}).freeze()
+    before = state(schema)
+    schema.validate({'a': [1, 'x'], 'd': 1})
+    with raises(SchemaError):
+        schema.validate({'a': [1], 'b': [2]})
+    assert state(schema) == before
+
+
+@mark.skipif(not os.path.exists('/proc/self/smaps_rollup') or not hasattr(os, 'fork'),
+             reason="Requires /proc/self/smaps_rollup and fork")
+def test_freeze_fork():
+    import gc
+    def private_dirty():
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Private_Dirty:'):
+                    return int(line.split()[1])
+    # the memory written by a child validating data, in kB
+    def dirty_in_child(schema):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                start = private_dirty()
+                for _ in range(100):
+                    schema.validate({'key1': 1, 'key2': {'a': [1]}})
+                gc.collect()
+                os.write(write, str(private_dirty() - start).encode())
+            finally:
+                os._exit(0)
+        try:
+            os.waitpid(pid, 0)
+            return int(os.read(read, 100))
+        finally:
+            os.close(read)
+            os.close(write)
+    schema = Schema({Optional('key%d' % i): Or(int, str, {'a': [int]}) for i in range(5000)})
+    not_frozen = dirty_in_child(schema)
+    try:
+        frozen = dirty_in_child(schema.freeze())
+    finally:
+        gc.unfreeze()
+    # most of the schema is still shared with the parent
+    assert frozen < not_frozen / 4
+
+
+def test_dict_direct_keys():
+    # the constant keys are found without being validated
+    schema = Schema({'a': int, Optional('b'): int, str: str})
+    assert [direct for _, _, direct, _ in schema._schema._comparable_keys['a']] == [True, False]
+    assert schema.validate({'a': 1, 'b': 2, 'c': 'd'}) == {'a': 1, 'b': 2, 'c': 'd'}
+    # the key of the data is kept
+    assert Schema({1: str}).validate({1.0: 'a'}) == {1.0: 'a'}
+    # unless validate is overridden
+    class Upper(Schema):
+        def validate(self, data):
+            return super(Upper, self).validate(data).upper()
+    assert Schema({Upper('a'): int}).validate({'a': 1}) == {'A': 1}
+    with raises(SchemaError):
+        Schema({Optional('a'): int}).validate({'a': 'x'})
+
+
+def test_dict_coverage_bits():
+    schema = Schema({'a': int, 'b': int, Optional('c', default=3): int, Optional('d'): int,
+                     Optional('e', default=list): list, Optional(str): object})
+    assert schema._schema._required_bits == 0b11
+    assert schema.validate({'a': 1, 'b': 2}) == {'a': 1, 'b': 2, 'c': 3, 'e': []}
+    assert schema.validate({'a': 1, 'b': 2, 'c': 4, 'f': 1}) == {'a': 1, 'b': 2, 'c': 4, 'e': [], 'f': 1}
+    with raises(SchemaMissingKeyError) as e:
+        schema.validate({'c': 1})
+    assert e.value.args[0] == "Missing keys: 'a', 'b'"
+
+
+def test_optional_copy_default():
+    default = {'tags': [], 'level': 1}
+    schema = Schema({'a': int, Optional('b', default=default): dict, Optional('c', default=list): list,
+                     Optional('d', default=0): int, Optional('e', default=[1], copy_default=True): list,
+                     Optional('f', default=[[1], 2], copy_default=True): list,
+                     Optional('g', default=default, copy_default=True): dict})
+    first = schema.validate({'a': 1})
+    assert first == {'a': 1, 'b': default, 'c': [], 'd': 0, 'e': [1], 'f': [[1], 2], 'g': default}
+    assert first['b'] is default
+    assert first['e'] is not schema.validate({'a': 1})['e']
+    first['f'][0].append(2)
+    first['g']['tags'].append('x')
+    assert schema.validate({'a': 1})['f'] == [[1], 2]
+    assert default == {'tags': [], 'level': 1}
+    assert type(first['g']) is dict and schema.validate(first) == first
+    # only the missing defaults are added
+    assert schema.validate({'a': 1, 'c': [1], 'd': 2}) == {
+        'a': 1, 'b': default, 'c': [1], 'd': 2, 'e': [1], 'f': [[1], 2], 'g': default}
+    with raises(ValueError):
+        Optional('a', default=[], copy_default='lazy')
+
+
+def test_stats():
+    import asyncio
+    import pickle
+    schema = Schema({'a': int, 'b': [str]}, stats=True)
+    assert schema.validate({'a': 1, 'b': []}) == {'a': 1, 'b': []}
+    assert not schema.is_valid({'a': 'x', 'b': []})
+    assert not schema.is_valid({'b': []})
+    assert asyncio.run(schema.validate_async({'a': 1, 'b': ['x']})) == {'a': 1, 'b': ['x']}
+    stats = schema.stats.to_dict()
+    assert stats['validations'] == 4
+    assert stats['failures'] == {'SchemaUnexpectedTypeError': 1, 'SchemaMissingKeyError': 1}
+    assert stats['latency']['count'] == 4 and stats['latency']['buckets'][float('inf')] == 4
+    assert schema._schema.stats is None
+    text = schema.stats.to_prometheus(labels={'schema': 'user'})
+    assert 'schema_validation_total{schema="user"} 4\n' in text
+    assert 'schema_validation_failures_total{error="SchemaMissingKeyError",schema="user"} 1\n' in text
+    assert 'schema_validation_seconds_bucket{le="+Inf",schema="user"} 4\n' in text
+    assert 'schema_validation_seconds_count{schema="user"} 4\n' in text
+    assert pickle.loads(pickle.dumps(schema)).stats.validations == 4
+    schema.stats.reset()
+    assert schema.stats.validations == 0
+    # shared stats, and stats of all the schemas
+    shared = ValidationStats(buckets=[0.5, 1])
+    assert shared.buckets == (0.5, 1, float('inf'))
+    Schema(int, stats=shared).validate(1)
+    Schema(str, stats=shared).is_valid(1)
+    assert shared.to_dict()['failures'] == {'SchemaUnexpectedTypeError': 1}
+    schema = Schema({'a': [int]}, options={'stats': True})
+    schema.validate({'a': [1, 2]})
+    assert schema.stats.validations == schema._schema.stats.validations == 1
+    assert schema._schema._schemas['a'].stats.validations == 1
+    assert schema._schema._schemas['a']._schema._schema.stats.validations == 2
+
+
+def test_list_sample():
+    import asyncio
+    schema = List([int], sample=0.1, seed=1)
+    indices = schema.sampled_indices(100)
+    assert len(indices) == 12 and indices[0] == 0 and indices[-1] == 99 and indices == sorted(set(indices))
+    assert schema.sampled_indices(100) == indices
+    assert List([int], sample=0.1, seed=2).sampled_indices(100) != indices
+    assert List([int], sample_size=3).sampled_indices(10)[1:-1] != [] and len(List([int], sample_size=3).sampled_indices(10)) == 5
+    assert List([int], sample_size=3).sampled_indices(4) == [0, 1, 2, 3]
+    assert List([int]).sampled_indices(3) == [0, 1, 2]
+    # the unchecked items are not validated
+    data = list(range(100))
+    unchecked = next(i for i in range(100) if i not in indices)
+    data[unchecked] = 'x'
+    assert schema.validate(data) is data
+    assert schema.validate_iterative(data) is data
+    assert asyncio.run(schema.validate_async(data)) is data
+    # a failing sample falls back to a full validation
+    data = list(range(100))
+    data[indices[3]] = 'x'
+    for validate in (schema.validate, schema.validate_iterative, lambda d: asyncio.run(schema.validate_async(d))):
+        with raises(SchemaError) as e:
+            validate(data)
+        assert e.value.code == "'x' should be instance of 'int'"
+    converted = List(Use(int), sample_size=1)
+    assert converted.validate(['1', '2', '3', '4']) == ['1', '2', '3', '4']
+    assert converted.validate(['1', '2', '3']) == [1, 2, 3]
+    assert converted.validate({'1', '2', '3'}) == {1, 2, 3}
+    with raises(ValueError):
+        List([int], sample=2)
+    with raises(ValueError):
+        List([int], sample_size=-1)
+
+
+def test_validate_incremental():
+    calls = []
+    def port(value):
+        calls.append(value)
+        return int(value)
+    schema = Schema({
+        'name': str,
+        Optional('debug', default=False): bool,
+        Or('host', 'socket', only_one=True): str,
+        'servers': [{'host': str, 'port': Use(port)}],
+        Optional('limits'): {str: int},
+    })
+    data = {'name': 'a', 'host': 'h', 'servers': [{'host': 'x', 'port': '1'}, {'host': 'y', 'port': '2'}],
+            'limits': {'a': 1}}
+    previous = schema.validate(data)
+    del calls[:]
+    # only the changed item is validated again
+    data['servers'][1] = {'host': 'y', 'port': '3'}
+    validated = schema.validate_incremental(data, [('servers', 1)], previous)
+    assert validated == schema.validate(data) and calls == ['3', '1', '3']
+    assert validated['limits'] is previous['limits'] and validated['servers'][0] is previous['servers'][0]
+    del calls[:]
+    data['servers'][0]['port'] = '4'
+    validated = schema.validate_incremental(data, ['/servers/0/port'], validated)
+    assert validated['servers'] == [{'host': 'x', 'port': 4}, {'host': 'y', 'port': 3}] and calls == ['4']
+    # the lists whose length changes are validated again
+    del calls[:]
+    data['servers'].append({'host': 'z', 'port': '5'})
+    validated = schema.validate_incremental(data, ['/servers/2'], validated)
+    assert [s['port'] for s in validated['servers']] == [4, 3, 5] and calls == ['4', '3', '5']
+    # the dicts along the paths are still checked
+    data['socket'] = 's'
+    with raises(SchemaOnlyOneAllowedError):
+        schema.validate_incremental(data, ['/socket'], validated)
+    del data['socket']
+    del data['name']
+    with raises(SchemaMissingKeyError):
+        schema.validate_incremental(data, [('name',)], validated)
+    data['name'] = 'b'
+    data['limits']['b'] = 'x'
+    with raises(SchemaError):
+        schema.validate_incremental(data, ['/limits/b'], validated)
+    del data['limits']['b']
+    assert schema.validate_incremental(data, ['/limits/b', ('name',)], validated) == schema.validate(data)
+    assert schema.validate_incremental(data, [''], validated) == schema.validate(data)
+
+
+def test_or_constants():
+    schema = Or(*range(100), 'a')
+    assert schema._constants == frozenset(list(range(100)) + ['a'])
+    assert schema.validate(99) == 99
+    # the constants are compared like before
+    assert schema.validate(True) is True
+    assert schema.validate(1.0) == 1.0
+    with raises(SchemaError) as e:
+        schema.validate('b')
+    assert e.value.autos[-1] == "'a' does not match 'b'"
+    with raises(SchemaError):
+        schema.validate([])
+    assert Or(1, int)._constants is None
+    assert Or(float('nan'))._constants is None
+    assert Or([1], {'a': 1})._constants is None
+
+
+def test_in():
+    schema = In(['a', 'b', 1, [2]])
+    assert schema.validate('a') == 'a'
+    assert schema.validate([2]) == [2]
+    # bools are not ints
+    with raises(SchemaError):
+        schema.validate(True)
+    with raises(SchemaError):
+        In([0, 'a']).validate(False)
+    assert In([True, 0]).validate(True) is True
+    assert In([True, 0]).validate(0) == 0
+    with raises(SchemaError):
+        In([True]).validate(1)
+    with raises(SchemaError):
+        In([False]).validate(0)
+    keys = Schema({Optional(In([1])): str, Optional(bool): int})
+    assert keys.validate({1: 'a'}) == {1: 'a'}
+    assert keys.validate({True: 2}) == {True: 2}
+    with raises(SchemaError) as e:
+        schema.validate('c')
+    assert e.value.code == "In(['a', 'b', 1, [2]]) does not match 'c'"
+    assert Schema({In(['a', 'b']): int, str: str}).validate({'a': 1, 'c': 'd'}) == {'a': 1, 'c': 'd'}
+    with raises(SchemaError):
+        Schema({In(['a', 'b']): int}).validate({'b': 'x'})
+    assert In(['a', 'b']).json_schema() == {'enum': ['a', 'b']}
+    assert In([True, 1, None]).json_schema() == {'enum': [1, True, None]}
+    assert In(['a']).json_schema(target='json_schema') == {'const': 'a'}
+    assert In([]).json_schema() is False
+
+
+def test_or_dispatch():
+    schema = Or(int, str, {'id': int}, [int], Use(float))
+    assert [s for s in schema._dispatch[str]] == [schema._args[1], schema._args[4]]
+    assert [s for s in schema._dispatch[dict]] == [schema._args[2], schema._args[4]]
+    # bool is an int
+    assert schema._args[0] in schema._dispatch[bool]
+    assert schema.validate(1) == 1
+    assert schema.validate({'id': 1}) == {'id': 1}
+    assert schema.validate([1]) == [1]
+    assert schema.validate(1.5) == 1.5
+    assert schema.validate('1') == '1'
+    assert schema.validate(b'1') == 1.0
+    # the error is the one of the last schema
+    with raises(SchemaError) as e:
+        Or(int, str).validate(1.5)
+    assert e.value.autos == ['Or(%r, %r) did not validate 1.5' % (Schema(int), Schema(str)),
+                             "1.5 should be instance of 'str'"]
+    with raises(SchemaUnexpectedTypeError):
+        Or(int, str).validate(None)
+    # the other types try all the schemas
+    assert Or(int, lambda x: True).validate(Mock) is Mock
+    from collections import OrderedDict
+    assert Or(str, {'a': int}).validate(OrderedDict(a=1)) == {'a': 1}
+    assert Or(Not(int), int).validate(1.5) == 1.5
+    # the unhashable constants are tried for any data
+    from types import MappingProxyType
+
+    class P(object):
+        __hash__ = None
+
+        def __init__(self, x):
+            self.x = x
+
+        def __eq__(self, other):
+            return type(other) is P and other.x == self.x
+
+    schema = Or(P(0), None, int)
+    assert schema.validate(P(0)) == P(0)
+    assert schema.validate(None) is None
+    assert schema.validate(1) == 1
+    with raises(SchemaError):
+        schema.validate(P(1))
+    assert Or(MappingProxyType({'a': 1}), str).validate({'a': 1}) == {'a': 1}
+    # the subclasses overriding validate can convert any data
+
+    class Coerce(Schema):
+        def validate(self, data):
+            return self._schema(data)
+
+    assert Or(Coerce(int), None).validate('5') == 5
+    assert Or(Schema(Coerce(int)), None).validate('5') == 5
+
+
+def test_and_or_flatten():
+    f = lambda n: n >= 0
+    schema = And(And(int, And(f)), Any(), Or(Or(int, float), str))
+    assert [repr(s) for s in schema._args] == [repr(Schema(int)), repr(Schema(f)),
+                                               repr(Or(int, float, str))]
+    assert schema.validate(1) == 1
+    with raises(SchemaUnexpectedTypeError):
+        schema.validate('1')
+    # the branches after Any are never tried, the last one is always kept
+    assert repr(Or('a', Or('b', 'a'), Any(), int)) == repr(Or('a', 'b', 'a', Any()))
+    assert repr(Or(int, int, str)) == repr(Or(int, str))
+    # schemas with their own error or only_one are kept
+    assert len(Or(Or(1, 2, error='e'), 3)._args) == 2
+    assert len(Or(Or(1, 2, only_one=True), 3)._args) == 2
+    with raises(SchemaError) as e:
+        Or(3, Or(1, error='e')).validate(1.5)
+    assert e.value.errors[-1] == 'e'
+    assert And(Use(int), And(Use(str))).validate(1.5) == '1'
+
+
+def test_dict_lookups():
+    schema = Schema({'a': int, Optional('b', default=2): int}, ignore_extra_keys=True)
+    assert schema._schema._lookups is not None
+    assert schema.validate({'a': 1, 'c': 'x'}) == {'a': 1, 'b': 2}
+    assert schema.validate({'a': 1, 'b': 3}) == {'a': 1, 'b': 3}
+    with raises(SchemaMissingKeyError):
+        schema.validate({'b': 1})
+    with raises(SchemaError) as e:
+        schema.validate({'a': 'x'})
+    assert e.value.autos[1:] == ["Key 'a' error:", "'x' should be instance of 'int'"]
+    # the other keys are matched
+    assert Schema({'a': int, str: str}, ignore_extra_keys=True)._schema._lookups is None
+    assert Schema({'a': int, Forbidden('b'): int}, ignore_extra_keys=True)._schema._lookups is None
+    assert Schema({'a': int})._schema._lookups is None
+
+
+def test_project():
+    schema = Schema({'meta': {'tenant': str, 'type': Or('a', 'b'), Optional('v', default=1): int},
+                     'items': [{'id': int, 'name': str}], 'raw': Use(int), str: object})
+    projected = schema.project(['meta.tenant', 'meta.v', 'items[].id', 'raw'])
+    data = {'meta': {'tenant': 't', 'type': 'x'}, 'items': [{'id': 1, 'name': 2}], 'raw': '3', 'other': 4}
+    assert projected.validate(data) == {'meta': {'tenant': 't', 'v': 1}, 'items': [{'id': 1}], 'raw': 3}
+    with raises(SchemaMissingKeyError) as e:
+        projected.validate({'meta': {}, 'items': [], 'raw': 1})
+    assert e.value.code == "Key 'meta' error:\nMissing key: 'tenant'"
+    with raises(SchemaError):
+        projected.validate(dict(data, items=[{'id': 'x'}]))
+    # the other keys are optional and only match the selected keys
+    assert schema.project(['extra']).validate({'extra': 1, 'meta': None}) == {'extra': 1}
+    assert schema.project([]).validate({'extra': 1}) == {}
+    assert schema.project(['']) is schema
+    lazy = Lazy(lambda: {'a': int, 'b': int})
+    assert Or(None, [lazy]).project(['[].a']).validate([{'a': 1, 'b': 'x'}]) == [{'a': 1}]
+    # the paths matching no key are errors
+    with raises(ValueError):
+        schema.project(['meta.nope'])
+    with raises(ValueError):
+        schema.project(['items.id'])
+    with raises(ValueError):
+        Or(None, {'a': int}).project(['b'])
+    either = Or({'a': int}, {'b': int}).project(['b'])
+    assert either.validate({'b': 1, 'c': 2}) == {'b': 1}
+    assert Or(int, Use(str)).project(['a']).validate(1) == 1
+
+
+def test_view():
+    schema = Schema({'meta': {'tenant': str, Optional('v', default=1): int},
+                     'items': [{'id': Use(int)}], Optional(str): object})
+    data = {'meta': {'tenant': 't'}, 'items': [{'id': '1'}, {'id': 'x'}], 'other': 2}
+    view = schema.view(data)
+    assert list(view) == ['meta', 'items', 'other']
+    assert view['meta']['v'] == 1
+    assert view['items'][0]['id'] == 1
+    assert view['items'][0] is view['items'][0]
+    with raises(SchemaError) as e:
+        view['items'][1]['id']
+    assert e.value.autos[0] == "Key 'id' error:"
+    assert view['meta'] == {'tenant': 't', 'v': 1}
+    with raises(KeyError):
+        view['missing']
+    # the keys and the lengths are checked up front
+    with raises(SchemaMissingKeyError):
+        schema.view({'items': []})
+    with raises(SchemaWrongKeyError):
+        Schema({'a': int}).view({'a': 1, 'b': 2})
+    with raises(SchemaWrongLengthError):
+        List([int], length=2).view([1])
+    # the views are equal to the validated data, and can be materialized
+    valid = {'meta': {'tenant': 't'}, 'items': [{'id': '1'}, {'id': 2}], 'other': 2}
+    assert schema.view(valid) == schema.validate(valid)
+    assert schema.view(valid)['items'] == [{'id': 1}, {'id': 2}]
+    assert schema.view(valid)['items'] != [{'id': 1}]
+    assert schema.view(valid)['items'] != ({'id': 1}, {'id': 2})
+    import json
+    assert json.loads(json.dumps(schema.view(valid).materialize())) == schema.validate(valid)
+    assert type(schema.view(valid).materialize()['items'][0]) is dict
+    assert Schema((int,)).view((1, 2)).materialize() == (1, 2)
+    # the dicts with hooks are validated
+    assert type(Schema({Forbidden('a'): int, 'b': int}).view({'b': 1})) is dict
+    assert Schema(int).view(1) == 1
+
+
+def test_dict_into():
+    Point = namedtuple('Point', 'x y label')
+
+    class Slots(object):
+        __slots__ = ('x', 'y', 'label')
+
+        def __init__(self, x, y, label):
+            self.x, self.y, self.label = x, y, label
+
+    keys = {'x': int, 'y': Use(int), Optional('label', default='?'): str}
+    assert Dict(keys, into='tuple').validate({'x': 1, 'y': '2'}) == (1, 2, '?')
+    assert Dict(keys, into=Point).validate({'y': 2, 'x': 1, 'label': 'a'}) == Point(1, 2, 'a')
+    slots = Dict(keys, into=Slots).validate({'x': 1, 'y': 2})
+    assert (slots.x, slots.y, slots.label) == (1, 2, '?')
+    assert Dict({'a': int, Optional('b'): int, Optional('c', default=list): list},
+                into='tuple').validate({'a': 1}) == (1, None, [])
+    with raises(SchemaMissingKeyError):
+        Dict(keys, into='tuple').validate({'x': 1})
+    with raises(SchemaWrongKeyError):
+        Dict(keys, into='tuple').validate({'x': 1, 'y': 2, 'z': 3})
+    assert Dict(keys, into='tuple', ignore_extra_keys=True).validate({'x': 1, 'y': 2, 'z': 3}) == (1, 2, '?')
+    with raises(SchemaError) as e:
+        Dict(keys, into='tuple').validate({'x': 'a', 'y': 2})
+    assert e.value.autos[0] == "Key 'x' error:"
+    # the other validations return records too
+    assert Schema([Dict(keys, into='tuple')]).validate_iterative([{'x': 1, 'y': 2}]) == [(1, 2, '?')]
+    with raises(ValueError):
+        Dict({str: int}, into='tuple')
+    with raises(ValueError):
+        Dict(keys, into='list')
+
+
+def test_object():
+    from dataclasses import dataclass, field
+
+    @dataclass(frozen=True)
+    class Point:
+        x: int
+        y: int
+        tags: list = field(default_factory=list)
+
+    point = Point(1, 2, ['a'])
+    schema = Object(Point, {'x': int, 'y': int, Optional('tags'): [str]})
+    assert schema.validate(point) is point
+    converted = Object(Point, {'x': Use(str), 'y': int}).validate(point)
+    assert converted == Point('1', 2, ['a']) and point.x == 1
+    assert Object(None, {'x': int, Optional('z', default=0): int}, as_dict=True).validate(point) == {'x': 1, 'z': 0}
+    with raises(SchemaUnexpectedTypeError):
+        schema.validate({'x': 1, 'y': 2})
+    with raises(SchemaError) as e:
+        schema.validate(Point('a', 2))
+    assert e.value.autos[0] == "Attribute 'x' error:"
+    with raises(SchemaMissingKeyError) as e:
+        Object(None, {'x': int, 'w': int}).validate(point)
+    assert e.value.code == "Missing attribute: 'w'"
+    assert Or(int, schema).validate(point) is point
+    assert schema.json_schema()['properties']['x'] == {'type': 'integer'}
+    with raises(ValueError):
+        Object(Point, {str: int})
+
+
+def test_dict_mapping():
+    from collections import ChainMap, OrderedDict
+    from collections.abc import Mapping
+    from types import MappingProxyType
+
+    class Row(Mapping):
+        def __init__(self, values):
+            self.values, self.reads = values, 0
+
+        def __getitem__(self, key):
+            self.reads += 1
+            return self.values[key]
+
+        def __iter__(self):
+            return iter(self.values)
+
+        def __len__(self):
+            return len(self.values)
+
+    schema = Schema({'a': int, Optional('b', default=2): int, Optional(str): object})
+    assert schema.validate(MappingProxyType({'a': 1})) == {'a': 1, 'b': 2}
+    assert type(schema.validate(ChainMap({'a': 1}, {'c': 3}))) is dict
+    assert type(schema.validate(OrderedDict(a=1))) is OrderedDict
+    row = Row({'a': 1, 'c': 'd'})
+    assert schema.validate(row) == {'a': 1, 'b': 2, 'c': 'd'}
+    assert row.reads == 2
+    assert Or(int, schema).validate(row) == {'a': 1, 'b': 2, 'c': 'd'}
+    with raises(SchemaUnexpectedTypeError):
+        Schema({'a': int}, strict=True).validate(MappingProxyType({'a': 1}))
+    assert Schema({'a': int}, strict=True).validate({'a': 1}) == {'a': 1}
+
+
+def test_dict_validate_rows():
+    import csv
+    import io
+
+    text = 'name,age,note\nann,3,a\nbob,x,b\ncat,5,c\n'
+    keys = {'name': str, 'age': Use(int), Optional('city', default='?'): str}
+    schema = Dict(keys, ignore_extra_keys=True)
+    errors = []
+    assert list(schema.validate_rows(csv.reader(io.StringIO(text)), errors=errors)) == [
+        {'name': 'ann', 'age': 3, 'city': '?'},
+        {'name': 'cat', 'age': 5, 'city': '?'},
+    ]
+    assert [number for number, _ in errors] == [3]
+    assert errors[0][1].autos[:2] == ['Row 3 error:', "Key 'age' error:"]
+    with raises(SchemaError):
+        list(schema.validate_rows(csv.reader(io.StringIO(text))))
+    with raises(SchemaError):
+        list(schema.validate_rows(csv.reader(io.StringIO(text)), errors=[], max_errors=0))
+    records = Dict(keys, ignore_extra_keys=True, into='tuple').validate_rows([['3', 'ann']], header=['age', 'name'])
+    assert list(records) == [('ann', 3, '?')]
+    # the header is checked once
+    with raises(SchemaMissingKeyError):
+        list(schema.validate_rows([['name']]))
+    with raises(SchemaWrongKeyError):
+        list(Dict({'name': str}).validate_rows([['name', 'age']]))
+    with raises(SchemaWrongLengthError):
+        list(schema.validate_rows([['name', 'age'], ['ann']]))
+    assert list(schema.validate_rows([])) == []
+    # and its length
+    rows = [['name', 'age', 'note'], ['ann', '3', 'a']]
+    assert len(list(Dict(keys, ignore_extra_keys=True, min_length=3).validate_rows(rows))) == 1
+    with raises(SchemaWrongLengthError):
+        list(Dict(keys, ignore_extra_keys=True, min_length=4).validate_rows(rows))
+    with raises(SchemaWrongLengthError):
+        list(Dict(keys, ignore_extra_keys=True, max_length=2).validate_rows(rows))
+    assert len(list(Dict(keys, ignore_extra_keys=True, length=3).validate_rows(rows))) == 1
+    # the dicts with hooks validate the dict of each row
+    errors = []
+    forbidden = Dict({'name': str, Forbidden('age'): object, Optional(str): str})
+    assert list(forbidden.validate_rows([['name'], ['ann']], errors=errors)) == [{'name': 'ann'}]
+    assert list(forbidden.validate_rows([['name', 'age'], ['ann', '3']], errors=errors)) == []
+    assert type(errors[0][1]) is SchemaForbiddenKeyError